@@ -1,256 +1,321 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
-from webdriver_manager.chrome import ChromeDriverManager
-import time
+import argparse
 import os
+import time
+
+import config
+from browser import BrowserContext, create_driver, wait_for_page_ready, worker_profile_path
+from cdp_engine import CdpEngine, debugger_address
+from coordinator import CoordinatorClient, LeaseReporter
+from diagnostics import Diagnostics, log
+from image_harvester import ImageHarvester
+from job_queue import load_jobs
+from metrics import MetricsRecorder
+from progress_journal import ProgressJournal
+from prompt_cache import PromptCache
+from prompt_source import google_cookies
+from rate_control import AdaptiveRateController
+from resource_policy import ResourcePolicy, block_urls
+from supervisor import BrowserSupervisor
+from whisk_session import DUPLICATE, OVERLOADED, WhiskSession
+from worker_pool import WorkerPool
+
+
+def open_whisk_sessions(main_browser, attached=False):
+    """
+    Open one Whisk session per worker
+
+    In "tabs" mode every worker is a tab of the main browser. In "profiles"
+    mode worker 0 uses the main browser and every other worker gets its own
+    Chrome process with its own copy of the profile. When attached to a warm
+    browser, Whisk tabs left open by an earlier run are reused. With
+    SINGLE_TAB, worker 1 opens Whisk in the tab the main browser points at.
+    """
+    sessions = []
+    extra_browsers = []
+    reused = set()
+
+    for index in range(config.WORKER_COUNT):
+        name = f"worker {index + 1}" if config.WORKER_COUNT > 1 else None
+
+        if config.WORKER_MODE == "profiles" and index > 0:
+            driver = create_driver(worker_profile_path(config.CHROME_PROFILE_PATH, index), headless=config.HEADLESS)
+            driver.get(config.WHISK_URL)
+            browser = BrowserContext(driver)
+            extra_browsers.append(browser)
+            sessions.append(WhiskSession(browser, browser.current_handle, name=name))
+        else:
+            handle = main_browser.find_tab(config.WHISK_URL, exclude=reused) if attached else None
+            if handle:
+                reused.add(handle)
+            elif config.SINGLE_TAB and index == 0:
+                handle = main_browser.load(config.WHISK_URL)
+            else:
+                handle = main_browser.open_tab(config.WHISK_URL)
+            sessions.append(WhiskSession(main_browser, handle, name=name))
+
+    return sessions, extra_browsers
+
+
+def open_cdp_sessions(engine, main_browser, attached=False):
+    """
+    Open one DevTools-driven Whisk tab per worker in the main browser
+
+    WORKER_MODE is ignored, every worker is a tab. When attached to a warm
+    browser, Whisk tabs left open by an earlier run are reused. With
+    SINGLE_TAB, worker 1 takes over the tab the main browser points at.
+    """
+    sessions = []
+    for index in range(config.WORKER_COUNT):
+        name = f"worker {index + 1}" if config.WORKER_COUNT > 1 else None
+        reuse = attached
+        if config.SINGLE_TAB and index == 0:
+            if not (attached and main_browser.find_tab(config.WHISK_URL)):
+                main_browser.load(config.WHISK_URL)
+            reuse = True
+        sessions.append(engine.open_session(config.WHISK_URL, name=name, reuse=reuse))
+    return sessions
+
+
+def open_sessions(main_browser, attached=False):
+    """Open the Whisk sessions with the configured engine; returns (sessions, extra_browsers, engine)"""
+    if config.ENGINE == "cdp":
+        engine = CdpEngine(debugger_address(main_browser.driver))
+        return open_cdp_sessions(engine, main_browser, attached), [], engine
+
+    sessions, extra_browsers = open_whisk_sessions(main_browser, attached)
+    return sessions, extra_browsers, None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Submit prompts from a Google Sheet to Google Labs Whisk")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip prompts the previous run already submitted (see JOURNAL_FILE in config.py)")
+    parser.add_argument("--jobs", metavar="FILE",
+                        help="JSON file with a list of jobs to run instead of JOBS in config.py")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Messages and error screenshots are written by background threads from here on
+    diagnostics = Diagnostics(
+        log_file=config.LOG_FILE if config.ENABLE_LOGGING else None,
+        queue_size=config.LOG_QUEUE_SIZE,
+        block=config.LOG_QUEUE_FULL == "block",
+        screenshot_dir=config.SCREENSHOT_DIR if config.SCREENSHOT_ON_ERROR else None
+    )
+    diagnostics.start()
+    jobs = load_jobs(
+        config.JOBS,
+        jobs_file=args.jobs,
+        sheet_url=config.GOOGLE_SHEET_URL,
+        prompt_file=config.PROMPT_FILE,
+        source=config.PROMPT_SOURCE
+    )
+    journal = ProgressJournal(config.JOURNAL_FILE)
+    cache = None
+    if config.DEDUPE_PROMPTS:
+        cache = PromptCache(
+            config.PROMPT_CACHE_FILE,
+            max_entries=config.PROMPT_CACHE_MAX_ENTRIES,
+            max_age_days=config.PROMPT_CACHE_MAX_AGE_DAYS
+        )
+
+    metrics = MetricsRecorder(config.METRICS_FILE) if config.ENABLE_METRICS else None
+    harvester = None
+    if config.HARVEST_IMAGES:
+        harvester = ImageHarvester(
+            config.HARVEST_DIR,
+            max_pending=config.HARVEST_QUEUE_SIZE,
+            tile_wait=config.HARVEST_TILE_WAIT,
+            tiles_per_prompt=config.HARVEST_TILES_PER_PROMPT
+        )
+    rate_controller = None
+    if config.ADAPTIVE_RATE:
+        rate_controller = AdaptiveRateController(
+            initial_rate=config.RATE_INITIAL,
+            min_rate=config.RATE_MIN,
+            max_rate=config.RATE_MAX,
+            increase_step=config.RATE_INCREASE,
+            decrease_factor=config.RATE_DECREASE
+        )
+
+    resource_policy = ResourcePolicy(
+        blocked_urls=config.BLOCKED_URLS,
+        check_every=config.MEMORY_CHECK_EVERY,
+        tab_limit_mb=config.TAB_MEMORY_LIMIT_MB,
+        browser_limit_mb=config.BROWSER_MEMORY_LIMIT_MB,
+        reload_timeout=config.PAGE_LOAD_WAIT
+    )
+
+    coordinator = None
+    if config.COORDINATOR_URL:
+        coordinator = CoordinatorClient(
+            config.COORDINATOR_URL,
+            worker=config.COORDINATOR_WORKER_ID or None,
+            lease_seconds=config.LEASE_SECONDS
+        )
+
+    def pool_factory(job, job_journal):
+        def make_pool(sessions):
+            resource_policy.watch(supervisor.driver, supervisor.attached)
+            return WorkerPool(
+                sessions,
+                max_in_flight=config.MAX_IN_FLIGHT,
+                backoff_base=config.WORKER_BACKOFF_BASE,
+                backoff_max=config.WORKER_BACKOFF_MAX,
+                rate_controller=rate_controller,
+                journal=job_journal,
+                cache=cache,
+                metrics=metrics,
+                pipelined=config.PIPELINE_PROMPTS,
+                harvester=harvester,
+                max_retries=config.PROMPT_RETRIES,
+                health_timeout=config.HEALTH_CHECK_TIMEOUT,
+                resource_policy=resource_policy,
+                progress=job,
+                lease_reporter=LeaseReporter(coordinator, job.key) if coordinator else None,
+                diagnostics=diagnostics
+            )
+        return make_pool
+
+    # Initialize driver, or attach to the warm browser of an earlier run
+    supervisor = BrowserSupervisor(
+        open_sessions,
+        max_restarts=config.MAX_BROWSER_RESTARTS,
+        backoff_base=config.RESTART_BACKOFF_BASE,
+        backoff_max=config.RESTART_BACKOFF_MAX
+    )
+    driver = supervisor.start()
+    main_browser = supervisor.main_browser
+    attached = supervisor.attached
 
-# Setup Chrome options
-user_data_dir = "C:\\Users\\jubay\\selenium-automation-profile"
-if not os.path.exists(user_data_dir):
-    os.makedirs(user_data_dir)
-
-chrome_options = Options()
-chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
-chrome_options.add_argument("--start-maximized")
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-chrome_options.add_experimental_option("useAutomationExtension", False)
-
-# Additional options for better background operation
-chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-gpu-sandbox")
-chrome_options.add_experimental_option("detach", True)  # Keep browser open after script ends
-
-# Initialize driver
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-wait = WebDriverWait(driver, 10)
-actions = ActionChains(driver)
-
-try:
-    # Open Google Sheets in first tab
-    driver.get("https://docs.google.com/spreadsheets/d/1-znij-rdmpYyfHjrrtpmHtscKX7QE-q8Z-EfGlkpU/edit?gid=64971i5q1pjd-64971i5p1")
-    
-    # Wait for sheets to load
-    time.sleep(3)
-    
-    # Open Whisk in a new tab
-    driver.execute_script("window.open('https://labs.google/fx/tools/whisk/project/', '_blank');")
-    
-    # Store window handles
-    sheets_tab = driver.window_handles[0]
-    whisk_tab = driver.window_handles[1]
-    
-    print("Both tabs opened successfully. Starting automation...")
-    
-    # Wait for both tabs to load properly
-    time.sleep(5)
-    
-    # Switch back to Google Sheets
-    driver.switch_to.window(sheets_tab)
-    
-    # Counter for cells
-    cell_count = 1
-    empty_cells_count = 0
-    max_empty_cells = 3  # Stop after 3 consecutive empty cells
-    
-    # Initial selection of A1 - Find the first cell directly
-    time.sleep(2)
     try:
-        # Find the first cell (A1) in Google Sheets
-        first_cell = driver.find_element(By.CSS_SELECTOR, "div[role='gridcell']")
-        first_cell.click()
-        time.sleep(0.5)
-    except:
-        print("Could not locate first cell, using keyboard shortcut as fallback")
-        actions.key_down(Keys.CONTROL).send_keys(Keys.HOME).key_up(Keys.CONTROL).perform()
-        time.sleep(1)
-    
-    while True:
+        # None when every job reads a local file and the browser is only needed for Whisk
+        sheet_url = next((job.sheet_url for job in jobs.jobs if job.sheet_url and not job.prompt_file), None)
+        reader = driver
+        cookies = None
+        if not sheet_url:
+            reader = None
+        elif config.SINGLE_TAB and config.PROMPT_SOURCE != "dom":
+            # Read the prompts outside the browser, with its Google cookies, so no Sheets tab is opened
+            reader = None
+            if config.PROMPT_SOURCE == "export":
+                cookies = google_cookies(driver)
+        else:
+            if attached and not config.SINGLE_TAB:
+                # Open Google Sheets in first tab, reusing it if the warm browser has it open
+                sheets_tab = main_browser.find_tab(sheet_url.split("/edit")[0])
+                if not sheets_tab:
+                    sheets_tab = main_browser.open_tab(sheet_url)
+                driver.switch_to.window(sheets_tab)
+                main_browser.current_handle = sheets_tab
+            else:
+                # Open Google Sheets in the tab Whisk will use later with SINGLE_TAB
+                if config.BLOCKED_URLS and not attached:
+                    block_urls(driver, config.BLOCKED_URLS)
+                driver.get(sheet_url)
+
+            # Wait for sheets to load
+            wait_for_page_ready(driver, config.PAGE_LOAD_WAIT)
+
+        # Load every prompt of every job in one bulk read per job
+        load_started = time.perf_counter()
+        job_journals = {}
+        for job in jobs.ordered():
+            if config.PROMPT_SOURCE == "dom" and not job.prompt_file and job.sheet_url != sheet_url:
+                # The grid can only be read from the sheet that is open
+                sheet_url = job.sheet_url
+                driver.get(sheet_url)
+                wait_for_page_ready(driver, config.PAGE_LOAD_WAIT)
+            prompts = job.load(
+                config.PROMPT_SOURCE,
+                driver=reader,
+                max_empty_cells=config.MAX_EMPTY_CELLS,
+                export_format=config.EXPORT_FORMAT,
+                cookies=cookies
+            )
+            log(f"Loaded {len(prompts)} prompts " + (f"for job {job.name}" if job.name else "from the sheet"))
+
+            job_journal = job_journals[job] = journal.for_job(job.name)
+            if args.resume:
+                job.prompts = job_journal.remaining(prompts)
+                log(f"Resuming: skipping {len(prompts) - len(job.prompts)} prompts already submitted")
+            else:
+                job_journal.start_run(config.PROMPT_SOURCE, len(prompts))
+        if metrics:
+            metrics.record_run_stage("prompt_load", time.perf_counter() - load_started)
+
+        if harvester:
+            harvester.start()
+        results = []
         try:
-            print(f"\n--- Processing cell A{cell_count} ---")
-            
-            # Switch to Google Sheets tab
-            driver.switch_to.window(sheets_tab)
-            time.sleep(0.30)
-            
-            # Get the current cell content directly from the active cell
-            try:
-                # Find the currently selected cell in Google Sheets
-                active_cell = driver.find_element(By.CSS_SELECTOR, "div[role='gridcell'][aria-selected='true']")
-                cell_text = active_cell.text.strip()
-                print(f"Found cell content: '{cell_text[:50]}...'")
-            except:
-                # Fallback: try to get text from input box if cell is being edited
-                try:
-                    input_box = driver.find_element(By.CSS_SELECTOR, "input.waffle-cell-editor, textarea.waffle-cell-editor")
-                    cell_text = input_box.get_attribute('value') or input_box.text
-                    print(f"Found content in input box: '{cell_text[:50]}...'")
-                except:
-                    # Last resort: use keyboard copy (but focus the window first)
-                    print("Using keyboard copy as fallback")
-                    driver.switch_to.window(sheets_tab)
-                    driver.execute_script("window.focus();")
-                    actions.key_down(Keys.CONTROL).send_keys('c').key_up(Keys.CONTROL).perform()
-                    time.sleep(0.5)
-                    cell_text = None  # We'll paste directly later
-            
-            # Switch to Whisk tab
-            driver.switch_to.window(whisk_tab)
-            time.sleep(0.30)
-            
-            # Find the text input box
-            try:
-                # Try multiple possible selectors for the text input
-                text_input = None
-                
-                # Try to find by placeholder text
-                try:
-                    text_input = driver.find_element(By.XPATH, "//input[contains(@placeholder, 'Describe your idea or roll the dice for prompt ideas')]")
-                except:
-                    pass
-                
-                # If not found, try to find by type and position
-                if not text_input:
-                    # Clear any existing text using Selenium's clear method
-                    text_input.clear()
-                    time.sleep(0.25)
-                    
-                    # Input the text directly using Selenium (no clipboard needed)
-                    if cell_text is not None:
-                        text_input.send_keys(cell_text)
-                        pasted_text = cell_text
-                    else:
-                        # Fallback to clipboard paste if we couldn't get text directly
-                        text_input.send_keys(Keys.CONTROL + 'v')
-                        time.sleep(0.50)
-                        pasted_text = text_input.get_attribute('value')
-                    
-                    time.sleep(0.50)
-                if text_input:
-                    # Click on the input field
-                    text_input.click()
-                    time.sleep(0.25)
-                    
-                    # Clear any existing text
-                    text_input.send_keys(Keys.CONTROL + 'a')
-                    time.sleep(0.25)
-                    text_input.send_keys(Keys.DELETE)
-                    time.sleep(0.25)
-                    
-                    # Paste the copied content (Ctrl+V)
-                    text_input.send_keys(Keys.CONTROL + 'v')
-                    time.sleep(0.50)
-                    
-                    # Check if we pasted something (not empty)
-                    pasted_text = text_input.get_attribute('value')
-                    if not pasted_text or pasted_text.strip() == "":
-                        print(f"Cell A{cell_count} appears to be empty")
-                        empty_cells_count += 1
-                        if empty_cells_count >= max_empty_cells:
-                            print(f"Encountered {max_empty_cells} consecutive empty cells. Stopping automation.")
-                            break
-                    else:
-                        print(f"Pasted content from cell A{cell_count}: {pasted_text[:50]}...")
-                        empty_cells_count = 0  # Reset empty cells counter
-                        
-                        # Submit by pressing Enter key
-                        text_input.send_keys(Keys.ENTER)
-                        print("Submitted prompt by pressing Enter")
-                        
-                        # Check for overload warning and wait if needed
-                        time.sleep(0.50)  # Small delay before checking for popup
-                        
-                        try:
-                            # Look for the "Please wait. Processing the requested images" popup
-                            overload_popup = None
-                            
-                            # Try different ways to find the popup message
-                            popup_texts = [
-                                "Please wait. Loading requested images.",
-                                "Please wait",
-                                "Processing the requested images",
-                                "processing"
-                            ]
-                            
-                            for popup_text in popup_texts:
-                                try:
-                                    # Look for the popup by text
-                        # Clear the text box using Selenium's clear method
-                        try:
-                            text_input.clear()
-                            print("Cleared text box")
-                        except:
-                            print("Could not clear text box. It might have been cleared automatically")ted images'")
-                                print("    Pausing for 3 seconds to let Whisk catch up...")
-                                time.sleep(3)
-                            else:
-                                # Normal processing wait
-                                time.sleep(2)
-                        
-                        except Exception as e:
-                            # If we can't check for popup, just use normal wait time
-                            print("Could not check for overload popup: {e}")
-                            time.sleep(1)
-                        
-                        # Clear the text box
-                        try:
-                            text_input.click()
-                            text_input.send_keys(Keys.CONTROL + 'a')
-                            time.sleep(0.25)
-                            text_input.send_keys(Keys.DELETE)
-                            print("Cleared text box")
-                        except:
-                            print("Could not clear text box. It might have been cleared automatically")
-                
-                else:
-                    print("Could not find text input field!")
-                    break
-            
-            except Exception as e:
-                print(f"Error processing Whisk input: {e}")
-                pass
-            
-            # Move to next cell - try direct cell selection first
-            driver.switch_to.window(sheets_tab)
-            try:
-                # Try to find and click the next cell directly
-                next_cell_selector = f"div[role='gridcell'][data-row='{cell_count}'][data-col='0']"
-                next_cell = driver.find_element(By.CSS_SELECTOR, next_cell_selector)
-                next_cell.click()
-                print(f"Clicked directly on cell A{cell_count + 1}")
-            except:
-                # Fallback to arrow key navigation
-                print("Using arrow key navigation")
-                driver.execute_script("window.focus();")  # Ensure window has focus
-                actions.send_keys(Keys.DOWN).perform()
-            
-            time.sleep(0.3)
-            cell_count += 1
-        
+            # Open Whisk for every worker and submit job after job, restarting the browser if it dies
+            while len(jobs) and not supervisor.gave_up:
+                job = jobs.next_job()
+                if job.name:
+                    log(f"\n▶️  Job {job.name}: {len(job.prompts)} prompts (priority {job.priority})")
+                if harvester and job.folder:
+                    harvester.set_directory(os.path.join(config.HARVEST_DIR, job.folder))
+                make_pool = pool_factory(job, job_journals[job])
+                if not coordinator:
+                    results += supervisor.run(make_pool, job.prompts, job_journals[job])
+                    continue
+
+                # Every instance offers the rows it loaded; the coordinator adds each row once
+                added = coordinator.add(job.key, job.prompts)
+                log(f"Coordinator: {added} new or changed rows for {job.label}, claiming {config.CLAIM_BATCH} at a time as {coordinator.worker}")
+                for batch in coordinator.batches(job.key, config.CLAIM_BATCH):
+                    with coordinator.leased(job.key, batch):
+                        results += supervisor.run(make_pool, batch, job_journals[job])
+                    if supervisor.gave_up:
+                        break
         except KeyboardInterrupt:
-            print("\nAutomation interrupted by user")
-            break
-        except Exception as e:
-            print(f"Error in main loop: {e}")
-            cell_count += 1
-            continue
-
-    print(f"\n--- Automation completed ---")
-    print(f"Processed {cell_count - 1} cells")
-    print("\nYou can now download the generated images from Whisk")
-    
-    input("\nPress Enter to close the browser...")
-
-except Exception as e:
-    print(f"Fatal error: {e}")
-    input("\nPress Enter to close the browser...")
-
-finally:
-    driver.quit()
+            log("\nAutomation interrupted by user")
+            results = supervisor.results()
+
+        overloaded = sum(1 for _, outcome in results if outcome == OVERLOADED)
+        duplicates = sum(1 for _, outcome in results if outcome == DUPLICATE)
+        diagnostics.flush()
+
+        print(f"\n--- Automation completed ---")
+        print(f"Processed {len(results)} cells ({overloaded} hit the overload popup, {duplicates} duplicates skipped)")
+        if any(job.name for job in jobs.jobs):
+            for job in jobs.jobs:
+                print(f"  {job.summary()}")
+        if supervisor.restarts or supervisor.recycles:
+            print(f"The browser was restarted {supervisor.restarts} time(s) and recycled {supervisor.recycles} time(s)")
+        if rate_controller:
+            print(f"Final submission rate: {rate_controller.rate:.1f} prompts/min")
+        if metrics:
+            metrics.print_summary()
+        if harvester:
+            print("\nWaiting for the last images to be saved...")
+            harvester.close()
+            print(f"Saved {harvester.saved} images to {config.HARVEST_DIR} ({harvester.failed} could not be saved)")
+        else:
+            print("\nYou can now download the generated images from Whisk")
+
+        if not (supervisor.attached or config.HEADLESS):
+            input("\nPress Enter to close the browser...")
+
+    except Exception as e:
+        diagnostics.flush()
+        print(f"Fatal error: {e}")
+        if not (supervisor.attached or config.HEADLESS):
+            input("\nPress Enter to close the browser...")
+
+    finally:
+        if harvester:
+            harvester.close()
+        if cache:
+            cache.save()
+        if metrics:
+            gauges = rate_controller.metrics() if rate_controller else None
+            metrics.write_summary(config.METRICS_SUMMARY_FILE, config.METRICS_FORMAT, gauges)
+            metrics.close()
+        supervisor.close()
+        diagnostics.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the Sheet-to-Whisk automation
+
+Serves local stand-ins for Google Sheets and Whisk (benchmark_pages/),
+then drives the real prompt loading and submit loop against them in a
+headless Chrome. Reports prompts per second and per-stage latencies, so
+throughput changes can be measured without touching live Google services.
+
+Example:
+    python benchmark_automation.py --prompts 100 --workers 2 --popup 0.2
+"""
+
+import argparse
+import functools
+import http.server
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import config
+from browser import BrowserContext, create_driver, wait_for_page_ready
+from metrics import MetricsRecorder
+from prompt_source import load_prompts
+from rate_control import AdaptiveRateController
+from whisk_session import WhiskSession
+from worker_pool import WorkerPool
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_pages")
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler that doesn't print every request"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    """Serve the stand-in pages on a free localhost port"""
+    handler = functools.partial(QuietHandler, directory=PAGES_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the automation loop against local stand-in pages")
+    parser.add_argument("--prompts", type=int, default=50, help="rows in the stand-in sheet (default 50)")
+    parser.add_argument("--length", type=int, default=80, help="approximate prompt length in characters (default 80)")
+    parser.add_argument("--workers", type=int, default=1, help="parallel Whisk tabs (default 1)")
+    parser.add_argument("--popup", type=float, default=0.1, help="overload popup probability per submit (default 0.1)")
+    parser.add_argument("--latency", type=int, default=500, help="ms until a generation tile appears (default 500)")
+    parser.add_argument("--popup-ms", type=int, default=1000, help="ms the overload popup stays visible (default 1000)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the popup dice (default 1)")
+    parser.add_argument("--no-pipeline", action="store_true", help="submit strictly one step after another (PIPELINE_PROMPTS off)")
+    parser.add_argument("--headed", action="store_true", help="show the browser instead of running headless")
+    parser.add_argument("--output", help="also write the summary as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server, base_url = start_server()
+    profile_dir = tempfile.mkdtemp(prefix="autometion-bench-")
+    metrics = MetricsRecorder()
+
+    print("=" * 60)
+    print("   AUTOMETION - Offline Benchmark")
+    print("=" * 60)
+    print(f"{args.prompts} prompts, {args.workers} worker(s), popup {args.popup:.0%}, latency {args.latency} ms")
+
+    # The stand-in's generation request, for network completion detection
+    config.GENERATION_URL_PATTERN = r"/generate\.json"
+
+    driver = create_driver(profile_dir, headless=not args.headed)
+    try:
+        browser = BrowserContext(driver)
+
+        # Bulk-read the stand-in sheet exactly like the real run does with PROMPT_SOURCE = "dom"
+        sheet_query = urllib.parse.urlencode({"rows": args.prompts, "length": args.length})
+        driver.get(f"{base_url}/sheets.html?{sheet_query}")
+        wait_for_page_ready(driver, config.PAGE_LOAD_WAIT)
+
+        load_started = time.perf_counter()
+        prompts = load_prompts("dom", driver=driver, max_empty_cells=config.MAX_EMPTY_CELLS)
+        metrics.record_run_stage("prompt_load", time.perf_counter() - load_started)
+
+        sessions = []
+        for index in range(args.workers):
+            whisk_query = urllib.parse.urlencode({
+                "popup": args.popup,
+                "latency": args.latency,
+                "popup_ms": args.popup_ms,
+                "seed": args.seed + index,
+            })
+            handle = browser.open_tab(f"{base_url}/whisk.html?{whisk_query}")
+            name = f"worker {index + 1}" if args.workers > 1 else None
+            sessions.append(WhiskSession(browser, handle, name=name))
+        for session in sessions:
+            session.wait_until_ready(config.PAGE_LOAD_WAIT)
+
+        rate_controller = None
+        if config.ADAPTIVE_RATE:
+            rate_controller = AdaptiveRateController(
+                initial_rate=config.RATE_INITIAL,
+                min_rate=config.RATE_MIN,
+                max_rate=config.RATE_MAX,
+                increase_step=config.RATE_INCREASE,
+                decrease_factor=config.RATE_DECREASE
+            )
+
+        # No journal or prompt cache: every benchmark run must submit every prompt
+        pool = WorkerPool(
+            sessions,
+            max_in_flight=config.MAX_IN_FLIGHT,
+            backoff_base=config.WORKER_BACKOFF_BASE,
+            backoff_max=config.WORKER_BACKOFF_MAX,
+            rate_controller=rate_controller,
+            metrics=metrics,
+            pipelined=config.PIPELINE_PROMPTS and not args.no_pipeline
+        )
+
+        # Restart the clock so throughput covers the submit loop only
+        metrics.started_at = time.time()
+        pool.run(prompts)
+
+        summary = metrics.summary()
+        summary["settings"] = vars(args)
+        if rate_controller:
+            summary["rate_control"] = rate_controller.metrics()
+
+        metrics.print_summary()
+        print(f"\nOutcomes: {summary['outcomes']}")
+        print(f"Throughput: {summary['prompts_per_second']:.3f} prompts/s")
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+            print(f"Summary written to {args.output}")
+
+    finally:
+        driver.quit()
+        server.shutdown()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
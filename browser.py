@@ -0,0 +1,333 @@
+"""
+Chrome setup for the Sheet-to-Whisk automation
+
+Builds the Chrome options, launches drivers, and lets several Whisk
+sessions share one Chrome instance safely. To keep startup fast, the
+resolved chromedriver path is cached, and a run can attach to a Chrome
+that is already running instead of launching a fresh one.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+import config
+from completion_detector import PerformanceLog
+
+
+def uses_performance_log():
+    """
+    True if completion detection reads chromedriver's performance log
+
+    The CDP engine subscribes to Network events itself; a log nobody
+    drains would only buffer every event of every tab.
+    """
+    return config.DETECT_COMPLETION and config.ENGINE == "selenium"
+
+
+def enable_network_log(chrome_options):
+    """Record Network events in the performance log, for completion detection"""
+    if uses_performance_log():
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        chrome_options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+
+
+def window_arguments(headless=False):
+    """
+    Window and rendering switches for Chrome
+
+    Headless mode uses a small viewport and keeps background tabs at full
+    speed, since every Whisk tab but one is a background tab. Images can be
+    switched off too, to save decoding and painting them.
+    """
+    if not headless:
+        return ["--start-maximized"] if config.START_MAXIMIZED else []
+
+    arguments = [
+        "--headless=new",
+        f"--window-size={config.HEADLESS_WINDOW_SIZE}",
+        "--disable-background-timer-throttling",
+        "--disable-backgrounding-occluded-windows",
+        "--disable-renderer-backgrounding",
+        "--mute-audio",
+    ]
+    if config.HEADLESS_DISABLE_IMAGES:
+        arguments.append("--blink-settings=imagesEnabled=false")
+    return arguments
+
+
+def build_chrome_options(profile_path, headless=False):
+    """Chrome options shared by every browser the automation launches"""
+    chrome_options = Options()
+    chrome_options.add_argument(f"--user-data-dir={profile_path}")
+    for argument in window_arguments(headless):
+        chrome_options.add_argument(argument)
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option("useAutomationExtension", False)
+
+    # Additional options for better background operation
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-gpu-sandbox")
+    chrome_options.add_experimental_option("detach", True)  # Keep browser open after script ends
+    if config.TAB_MEMORY_LIMIT_MB:
+        # Otherwise performance.memory is rounded and only updated every few minutes
+        chrome_options.add_argument("--enable-precise-memory-info")
+    enable_network_log(chrome_options)
+    return chrome_options
+
+
+def resolve_driver_path():
+    """
+    Path to chromedriver, asking webdriver-manager only when needed
+
+    webdriver-manager checks versions and may hit the network, so its
+    answer is cached in DRIVER_CACHE_FILE. A pinned CHROMEDRIVER_VERSION
+    is cached for good; an unpinned one is re-checked after
+    DRIVER_CACHE_MAX_AGE_HOURS.
+    """
+    if config.CHROMEDRIVER_PATH:
+        return config.CHROMEDRIVER_PATH
+
+    pin = config.CHROMEDRIVER_VERSION or None
+    try:
+        with open(config.DRIVER_CACHE_FILE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = None
+
+    if cached and cached.get("version") == pin and os.path.exists(cached.get("path", "")):
+        age = time.time() - cached.get("resolved_at", 0)
+        if pin or age < config.DRIVER_CACHE_MAX_AGE_HOURS * 3600:
+            return cached["path"]
+
+    path = ChromeDriverManager(driver_version=pin).install()
+    with open(config.DRIVER_CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump({"version": pin, "path": path, "resolved_at": time.time()}, f)
+    return path
+
+
+def forget_driver_path():
+    """Drop the cached chromedriver path, e.g. after Chrome updated itself"""
+    if os.path.exists(config.DRIVER_CACHE_FILE):
+        os.remove(config.DRIVER_CACHE_FILE)
+
+
+def _start_chrome(options):
+    """Start a driver session, re-resolving chromedriver once if the cached one no longer fits Chrome"""
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_driver_path()), options=options)
+    except SessionNotCreatedException:
+        if config.CHROMEDRIVER_PATH:
+            raise
+        print("Cached chromedriver does not match Chrome, resolving it again...")
+        forget_driver_path()
+        driver = webdriver.Chrome(service=Service(resolve_driver_path()), options=options)
+
+    # A hung chromedriver call raises after this long instead of blocking its worker
+    # forever, so the worker can find the browser hung and have it restarted
+    executor = driver.command_executor
+    if hasattr(executor, "client_config"):
+        executor.client_config.timeout = config.COMMAND_TIMEOUT
+    else:
+        # Selenium before 4.26 only has the class-wide timeout
+        executor.set_timeout(config.COMMAND_TIMEOUT)
+    return driver
+
+
+def create_driver(profile_path, headless=False):
+    """Launch Chrome with the given profile directory"""
+    if not os.path.exists(profile_path):
+        os.makedirs(profile_path)
+
+    return _start_chrome(build_chrome_options(profile_path, headless))
+
+
+def find_chrome_binary():
+    """Locate the Chrome executable for launching a warm browser"""
+    if config.CHROME_BINARY:
+        return config.CHROME_BINARY
+
+    chrome_paths = [
+        'google-chrome',
+        'chrome',
+        'chromium',
+        'chromium-browser',
+        '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+        'C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe',
+        'C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe'
+    ]
+    for path in chrome_paths:
+        found = shutil.which(path) or (os.path.exists(path) and path)
+        if found:
+            return found
+    raise RuntimeError("Chrome not found, set CHROME_BINARY in config.py")
+
+
+def is_debugger_listening(address):
+    """True if a Chrome with remote debugging answers on address"""
+    try:
+        with urllib.request.urlopen(f"http://{address}/json/version", timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def launch_warm_browser(profile_path, address, timeout=15, headless=False):
+    """
+    Start Chrome with remote debugging enabled, detached from this script
+
+    The browser keeps running after the script exits, so the next run can
+    attach to it and skip the browser launch and page loads.
+    """
+    if not os.path.exists(profile_path):
+        os.makedirs(profile_path)
+
+    port = address.rsplit(":", 1)[1]
+    args = [
+        find_chrome_binary(),
+        f"--remote-debugging-port={port}",
+        f"--user-data-dir={profile_path}",
+        "--disable-blink-features=AutomationControlled",
+        "--no-first-run",
+    ] + window_arguments(headless)
+    if config.TAB_MEMORY_LIMIT_MB:
+        args.append("--enable-precise-memory-info")
+
+    popen_options = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == "nt":
+        popen_options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_options["start_new_session"] = True
+    subprocess.Popen(args, **popen_options)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if is_debugger_listening(address):
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"Chrome did not open remote debugging on {address}")
+
+
+def attach_driver(address):
+    """Connect to an already running Chrome through its debugger address"""
+    chrome_options = Options()
+    chrome_options.debugger_address = address
+    enable_network_log(chrome_options)
+    return _start_chrome(chrome_options)
+
+
+def start_browser(profile_path):
+    """
+    Get a driver for the main browser
+
+    Returns (driver, attached). With REMOTE_DEBUGGING_ADDRESS set, the
+    driver is attached to the warm browser on that address, which is
+    launched first if nothing is listening yet. HEADLESS applies to both.
+    """
+    address = config.REMOTE_DEBUGGING_ADDRESS
+    if not address:
+        return create_driver(profile_path, headless=config.HEADLESS), False
+
+    if not is_debugger_listening(address):
+        print(f"Launching a warm Chrome on {address} for this and later runs...")
+        launch_warm_browser(profile_path, address, headless=config.HEADLESS)
+    return attach_driver(address), True
+
+
+def wait_for_page_ready(driver, timeout):
+    """Wait until the current tab has finished loading, for at most timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if driver.execute_script("return document.readyState") == "complete":
+                return True
+        except Exception:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def worker_profile_path(base_path, index):
+    """
+    Profile directory for a worker Chrome process
+
+    Worker 0 uses the main profile. Every other worker gets its own copy,
+    made once from the main profile so it starts logged in. Chrome refuses
+    to share one profile between running processes.
+    """
+    if index == 0:
+        return base_path
+
+    path = f"{base_path.rstrip('/').rstrip(os.sep)}-worker-{index}"
+    if not os.path.exists(path):
+        if os.path.exists(base_path):
+            # Lock files belong to the running browser and must not be copied
+            shutil.copytree(base_path, path, ignore=shutil.ignore_patterns("Singleton*", "*.lock", "lockfile"))
+        else:
+            os.makedirs(path)
+    return path
+
+
+class BrowserContext:
+    """
+    One Chrome instance that one or more sessions drive
+
+    Selenium can only talk to one tab at a time, so every session holds
+    the lock while it uses the driver. Tab switches only happen when a
+    different session takes over.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.lock = threading.RLock()
+        self.current_handle = driver.current_window_handle
+        # Performance log shared by every tab, when completion detection is on
+        self.network_log = PerformanceLog(driver, self.lock) if uses_performance_log() else None
+
+    @contextmanager
+    def focus(self, handle):
+        """Hold the driver and make sure it points at the given tab"""
+        with self.lock:
+            if handle and handle != self.current_handle:
+                self.driver.switch_to.window(handle)
+                self.current_handle = handle
+            yield self.driver
+
+    def find_tab(self, url_prefix, exclude=()):
+        """Return the handle of an open tab whose URL starts with url_prefix, or None"""
+        with self.lock:
+            for handle in self.driver.window_handles:
+                if handle in exclude:
+                    continue
+                self.driver.switch_to.window(handle)
+                self.current_handle = handle
+                if self.driver.current_url.startswith(url_prefix):
+                    return handle
+            return None
+
+    def load(self, url):
+        """Show url in the tab the driver points at and return that tab's handle"""
+        with self.lock:
+            self.driver.get(url)
+            return self.current_handle
+
+    def open_tab(self, url):
+        """Open url in a new tab and return its window handle"""
+        with self.lock:
+            known = set(self.driver.window_handles)
+            self.driver.execute_script("window.open(arguments[0], '_blank');", url)
+            new_handles = [h for h in self.driver.window_handles if h not in known]
+            return new_handles[0]
@@ -0,0 +1,593 @@
+"""
+Asyncio engine that drives Whisk over the Chrome DevTools Protocol
+
+Instead of one chromedriver HTTP round trip per find_element, click or
+get_attribute, every Whisk tab gets its own DevTools WebSocket and all of
+them are served by one asyncio event loop. Page work happens in single
+Runtime.evaluate calls, and waits are promises resolved in the page by a
+MutationObserver, so nothing is polled over the wire and no tab has to be
+switched to. Tabs run concurrently without sharing a driver lock.
+
+CdpWhiskSession offers the same submit()/wait_until_ready() interface as
+WhiskSession, so the WorkerPool, journal, cache and metrics work with
+either engine. Set ENGINE = "cdp" in config.py to use it; it needs the
+websockets package (pip install websockets).
+"""
+
+import asyncio
+import base64
+import itertools
+import json
+import threading
+import urllib.parse
+import urllib.request
+
+import config
+from completion_detector import NETWORK_EVENTS, CompletionTracker, is_overload
+from diagnostics import log
+from image_harvester import READ_SCRIPT, TAG_SCRIPT, UNTAGGED_SCRIPT
+from input_injection import INJECT_SCRIPT
+from metrics import PromptTimer
+from popup_detection import DETECT_SCRIPT
+from resource_policy import MEMORY_SCRIPT
+from whisk_session import NO_INPUT, OVERLOADED, SUBMITTED
+
+
+# Helpers every page call is wrapped with. The injection and popup scripts
+# are shared with the Selenium engine and called here as plain functions.
+PAGE_HELPERS = """
+function findInput(selectors) {
+    for (var i = 0; i < selectors.length; i++) {
+        var by = selectors[i][0], value = selectors[i][1], element = null;
+        if (by === 'xpath') {
+            element = document.evaluate(value, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        } else if (by === 'css selector') {
+            element = document.querySelector(value);
+        } else if (by === 'tag name') {
+            element = document.getElementsByTagName(value)[0];
+        } else if (by === 'id') {
+            element = document.getElementById(value);
+        } else if (by === 'name') {
+            element = document.getElementsByName(value)[0];
+        }
+        if (element) { return element; }
+    }
+    return null;
+}
+
+function injectValue(element, value) {
+    return new Promise(function (done) {
+        (function () {
+""" + INJECT_SCRIPT + """
+        }).call(null, element, value, done);
+    });
+}
+
+function detectPopup(signatures) {
+""" + DETECT_SCRIPT + """
+}
+
+function countTiles(tileSelector) {
+    return document.querySelectorAll(tileSelector).length;
+}
+
+// Resolves once check() is true, re-checking on every DOM mutation. Input
+// values change without a mutation, so a cheap in-page timer re-checks too.
+function waitFor(check, timeoutMs) {
+    return new Promise(function (resolve) {
+        if (check()) { resolve(true); return; }
+        var observer = new MutationObserver(function () {
+            if (check()) { finish(true); }
+        });
+        var ticker = setInterval(function () {
+            if (check()) { finish(true); }
+        }, 50);
+        var timer = setTimeout(function () { finish(check()); }, timeoutMs);
+        function finish(result) {
+            observer.disconnect();
+            clearInterval(ticker);
+            clearTimeout(timer);
+            resolve(result);
+        }
+        observer.observe(document.documentElement, {
+            childList: true, subtree: true, attributes: true, characterData: true
+        });
+    });
+}
+"""
+
+# arguments: selectors, timeoutMs
+READY_SCRIPT = """
+var selectors = arguments[0];
+return waitFor(function () { return findInput(selectors) !== null; }, arguments[1]);
+"""
+
+# arguments: selectors, prompt. Returns null without an input, otherwise
+# whether the app kept the injected value.
+ENTER_SCRIPT = """
+var element = findInput(arguments[0]);
+if (!element) { return null; }
+var prompt = arguments[1];
+return injectValue(element, prompt).then(function (value) { return value === prompt; });
+"""
+
+# arguments: selectors. Focuses the input and selects its text, so
+# Input.insertText replaces it.
+SELECT_SCRIPT = """
+var element = findInput(arguments[0]);
+if (!element) { return false; }
+element.focus();
+element.select();
+return true;
+"""
+
+# arguments: selectors, prompt. Focuses the input if it still holds the
+# prompt staged during the previous cycle.
+STAGED_SCRIPT = """
+var element = findInput(arguments[0]);
+if (!element || element.value !== arguments[1]) { return false; }
+element.focus();
+return true;
+"""
+
+# arguments: selectors, tileSelector, timeoutMs. Sent before Enter is
+# pressed; resolves once the app clears the input or the page changes.
+ACCEPTED_SCRIPT = """
+var selectors = arguments[0];
+var tiles = countTiles(arguments[1]);
+var changed = false;
+var observer = new MutationObserver(function () { changed = true; observer.disconnect(); });
+observer.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true, characterData: true
+});
+return waitFor(function () {
+    var element = findInput(selectors);
+    return changed || !element || !(element.value || '').trim();
+}, arguments[2]).then(function (accepted) {
+    observer.disconnect();
+    return {accepted: accepted, tiles: tiles};
+});
+"""
+
+# arguments: signatures
+DETECT_CALL_SCRIPT = """
+var found = detectPopup(arguments[0]);
+return found && {signature: found.signature, text: found.text, rect: found.rect, cached: found.cached};
+"""
+
+# arguments: signatures, timeoutMs
+POPUP_GONE_SCRIPT = """
+var signatures = arguments[0];
+return waitFor(function () { return detectPopup(signatures) === null; }, arguments[1]);
+"""
+
+# arguments: tileSelector, tilesBefore, timeoutMs
+GENERATION_SCRIPT = """
+var tileSelector = arguments[0], before = arguments[1];
+return waitFor(function () { return countTiles(tileSelector) > before; }, arguments[2]);
+"""
+
+# arguments: selectors, value
+CLEAR_SCRIPT = """
+var element = findInput(arguments[0]);
+if (!element) { return false; }
+return injectValue(element, arguments[1]).then(function (value) { return value === ''; });
+"""
+
+# arguments: tileSelector, count, timeoutMs
+UNTAGGED_WAIT_SCRIPT = """
+var tileSelector = arguments[0];
+var count = arguments[1];
+function untagged() {
+    return (function () {""" + UNTAGGED_SCRIPT + """}).call(null, tileSelector);
+}
+return waitFor(function () { return untagged() >= count; }, arguments[2]);
+"""
+
+# arguments: tag
+READ_CALL_SCRIPT = """
+var tag = arguments[0];
+return new Promise(function (done) {
+    (function () {""" + READ_SCRIPT + """}).call(null, tag, done);
+});
+"""
+
+
+class CdpError(RuntimeError):
+    """A DevTools command failed or the page threw"""
+
+
+def _load_websockets():
+    """Import websockets only when the CDP engine is actually used"""
+    try:
+        import websockets
+    except ImportError:
+        raise ImportError("The CDP engine needs websockets: pip install websockets")
+    return websockets
+
+
+def page_call(body, *args):
+    """Expression running body as a function of args, with PAGE_HELPERS in scope"""
+    return "(function () {" + PAGE_HELPERS + body + "}).apply(null, " + json.dumps(args) + ")"
+
+
+def debugger_address(driver):
+    """Remote debugging address of the Chrome a Selenium driver controls"""
+    return driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+
+
+def list_targets(address):
+    """Every page target of the Chrome on address"""
+    with urllib.request.urlopen(f"http://{address}/json/list", timeout=5) as response:
+        return [target for target in json.load(response) if target.get("type") == "page"]
+
+
+def open_target(address, url):
+    """Open url in a new tab of the Chrome on address and return its target"""
+    request = urllib.request.Request(f"http://{address}/json/new?{urllib.parse.quote(url, safe='')}", method="PUT")
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.load(response)
+
+
+class CdpConnection:
+    """One DevTools WebSocket, with commands matched to their replies"""
+
+    def __init__(self, ws_url, command_timeout=30):
+        self.ws_url = ws_url
+        self.command_timeout = command_timeout
+        self.websocket = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = {}
+        self._reader = None
+
+    async def connect(self):
+        websockets = _load_websockets()
+        self.websocket = await websockets.connect(self.ws_url, max_size=None)
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        """Hand replies to the waiting commands and events to their listeners"""
+        try:
+            async for raw in self.websocket:
+                message = json.loads(raw)
+                if "id" in message:
+                    future = self._pending.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CdpError(message["error"].get("message", "DevTools error")))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    for callback in list(self._listeners.get(message.get("method"), ())):
+                        callback(message.get("params", {}))
+        except Exception:
+            # The tab was closed or the browser went away
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("DevTools connection closed"))
+            self._pending.clear()
+
+    async def request(self, method, params=None):
+        """Send a command and return the future of its reply without waiting for it"""
+        command_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[command_id] = future
+        await self.websocket.send(json.dumps({"id": command_id, "method": method, "params": params or {}}))
+        return future
+
+    async def send(self, method, params=None, timeout=None):
+        """Send a command and wait for its result"""
+        future = await self.request(method, params)
+        return await asyncio.wait_for(future, timeout or self.command_timeout)
+
+    def on(self, method, callback):
+        """Call callback(params) for every event with this method name"""
+        self._listeners.setdefault(method, []).append(callback)
+
+    def off(self, method, callback):
+        """Stop calling callback for this event"""
+        if callback in self._listeners.get(method, ()):
+            self._listeners[method].remove(callback)
+
+    async def close(self):
+        if self.websocket:
+            await self.websocket.close()
+        if self._reader:
+            await self._reader
+
+
+class CdpWhiskSession:
+    """A Whisk tab driven over its own DevTools connection"""
+
+    def __init__(self, engine, target, name=None):
+        self.engine = engine
+        self.target = target
+        self.name = name
+        self.connection = CdpConnection(target["webSocketDebuggerUrl"])
+        self.selectors = [list(selector) for selector in config.PROMPT_INPUT_SELECTORS]
+        self.signatures = list(config.POPUP_TEXTS)
+        # Prompt typed ahead into the input during the previous cycle, if any
+        self.staged_prompt = None
+        # Whether the current submit cycle got as far as pressing Enter
+        self.enter_sent = False
+        # Generation requests of this tab, when completion detection is on
+        self.network = CompletionTracker(config.GENERATION_URL_PATTERN) if config.DETECT_COMPLETION else None
+        self.network_changed = None
+
+    def log(self, message):
+        """Log a message, tagged with the session name when running in a pool"""
+        log(f"[{self.name}] {message}" if self.name else message)
+
+    async def connect(self):
+        await self.connection.connect()
+        await self.connection.send("Runtime.enable")
+        if self.network:
+            self.network_changed = asyncio.Event()
+            self.network.listeners.append(self.network_changed.set)
+            for method in NETWORK_EVENTS:
+                self.connection.on(method, lambda params, method=method: self.network.feed(method, params))
+            await self.connection.send("Network.enable")
+
+    async def evaluate_request(self, body, *args):
+        """Start a page call and return the future of its raw reply"""
+        return await self.connection.request("Runtime.evaluate", {
+            "expression": page_call(body, *args),
+            "awaitPromise": True,
+            "returnByValue": True,
+        })
+
+    async def evaluate(self, body, *args, timeout=None):
+        """Run body in the page with args and return its (awaited) value"""
+        future = await self.evaluate_request(body, *args)
+        return self._value(await asyncio.wait_for(future, timeout or self.connection.command_timeout))
+
+    def _value(self, reply):
+        if "exceptionDetails" in reply:
+            details = reply["exceptionDetails"]
+            raise CdpError(details.get("exception", {}).get("description") or details.get("text", "Script error"))
+        return reply.get("result", {}).get("value")
+
+    async def press_enter(self):
+        """Press Enter in the focused element"""
+        key = {"key": "Enter", "code": "Enter", "windowsVirtualKeyCode": 13, "nativeVirtualKeyCode": 13}
+        await self.connection.send("Input.dispatchKeyEvent", dict(key, type="keyDown", text="\r"))
+        await self.connection.send("Input.dispatchKeyEvent", dict(key, type="keyUp"))
+
+    async def wait_until_ready_async(self, timeout):
+        """Wait until the Whisk prompt input is on the page, for at most timeout seconds"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                return await self.evaluate(READY_SCRIPT, self.selectors, int(remaining * 1000),
+                                           timeout=remaining + 5)
+            except CdpError:
+                # The page navigated while we waited, try again in the new document
+                await asyncio.sleep(0.2)
+
+    async def _enter_prompt(self, prompt, timer):
+        """Replace the input's text with prompt; returns False if there is no input"""
+        with timer.stage("type"):
+            accepted = await self.evaluate(ENTER_SCRIPT, self.selectors, prompt)
+            if accepted is None:
+                return False
+            if accepted:
+                return True
+
+            # The app rejected the injected value, insert it like typed text instead
+            self.log("Direct input was not accepted, typing the prompt instead")
+            if not await self.evaluate(SELECT_SCRIPT, self.selectors):
+                return False
+            await self.connection.send("Input.insertText", {"text": prompt})
+            return True
+
+    async def _wait_for_completion(self, mark):
+        """Wait for the generation request a submit started, woken by its Network events"""
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        while True:
+            elapsed = loop.time() - started_at
+            done, completion = self.network.settle(mark, elapsed, config.WAIT_AFTER_SUBMIT, config.GENERATION_TIMEOUT)
+            if done:
+                return completion
+            # Sleep until the next event, or until it is time to give up on one
+            limit = config.GENERATION_TIMEOUT if self.network.started > mark else config.WAIT_AFTER_SUBMIT
+            self.network_changed.clear()
+            try:
+                await asyncio.wait_for(self.network_changed.wait(), max(limit - elapsed, 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def submit_async(self, row, prompt, timer=None, next_prompt=None):
+        """Run one submit cycle for a prompt, see WhiskSession.submit"""
+        timer = timer or PromptTimer(row)
+        self.enter_sent = False
+
+        staged, self.staged_prompt = self.staged_prompt, None
+        entered = False
+        if staged == prompt:
+            with timer.stage("input_locate"):
+                entered = await self.evaluate(STAGED_SCRIPT, self.selectors, prompt)
+        if not entered and not await self._enter_prompt(prompt, timer):
+            self.log("Could not find text input field!")
+            return NO_INPUT
+
+        self.log(f"Pasted content from row {row}: {prompt[:50]}...")
+
+        # Start watching the page before Enter goes out, so no reaction is missed
+        network_mark = self.network.mark() if self.network else None
+        with timer.stage("submit"):
+            accepted = await self.evaluate_request(
+                ACCEPTED_SCRIPT, self.selectors, config.GENERATION_TILE_SELECTOR, int(config.WAIT_FOR_ACCEPT * 1000)
+            )
+            self.enter_sent = True
+            await self.press_enter()
+            before_submit = self._value(await asyncio.wait_for(accepted, config.WAIT_FOR_ACCEPT + 5))
+        self.log("Submitted prompt by pressing Enter")
+
+        with timer.stage("popup_check"):
+            try:
+                overload_popup = await self.evaluate(DETECT_CALL_SCRIPT, self.signatures)
+            except CdpError as e:
+                self.log(f"Could not check for overload popup: {e}")
+                overload_popup = None
+
+        # Prepare the next prompt while Whisk works on this one
+        if next_prompt:
+            with timer.stage("prestage"):
+                try:
+                    if await self._enter_prompt(next_prompt, PromptTimer(row)):
+                        self.staged_prompt = next_prompt
+                except CdpError as e:
+                    self.log(f"Could not stage the next prompt: {e}")
+
+        completion = None
+        with timer.stage("wait"):
+            if overload_popup:
+                self.log(f"⚠️  Detected overload popup: '{overload_popup['text'][:60]}'")
+                self.log(f"    Waiting up to {config.WAIT_FOR_POPUP} seconds to let Whisk catch up...")
+                await self.evaluate(POPUP_GONE_SCRIPT, self.signatures, int(config.WAIT_FOR_POPUP * 1000),
+                                    timeout=config.WAIT_FOR_POPUP + 5)
+            # An overloaded prompt may still be generating, see WhiskSession.submit
+            if self.network:
+                # Until Whisk's generation request returns
+                completion = await self._wait_for_completion(network_mark)
+                if completion:
+                    timer.details["generation"] = {
+                        key: completion[key] for key in ("status", "latency", "failed", "error")
+                    }
+                    self.log(f"Generation request returned {completion['status'] or completion['error']} "
+                             f"after {completion['latency']}s")
+            else:
+                # Normal processing wait, until the generation tile appears
+                await self.evaluate(GENERATION_SCRIPT, config.GENERATION_TILE_SELECTOR, before_submit["tiles"],
+                                    int(config.WAIT_AFTER_SUBMIT * 1000), timeout=config.WAIT_AFTER_SUBMIT + 5)
+        overloaded = overload_popup or is_overload(completion)
+
+        # The input already holds the next prompt, so there is nothing to clear
+        if not self.staged_prompt:
+            with timer.stage("cleanup"):
+                try:
+                    await self.evaluate(CLEAR_SCRIPT, self.selectors, "")
+                    self.log("Cleared text box")
+                except CdpError:
+                    self.log("Could not clear text box. It might have been cleared automatically")
+
+        return OVERLOADED if overloaded else SUBMITTED
+
+    async def reload_async(self, timeout):
+        """Reload the tab and wait for the new document's prompt input"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self.staged_prompt = None
+        await self.evaluate("window.__autometionStale = true;")
+        await self.connection.send("Page.reload")
+        while loop.time() < deadline:
+            try:
+                if await self.evaluate("return !window.__autometionStale;"):
+                    break
+            except CdpError:
+                pass
+            await asyncio.sleep(0.1)
+        return await self.wait_until_ready_async(max(deadline - loop.time(), 0.1))
+
+    async def tag_new_images_async(self, wait=0, count=1):
+        """Tag the generation tiles that appeared since the last call, see WhiskSession.tag_new_images"""
+        if wait:
+            await self.evaluate(UNTAGGED_WAIT_SCRIPT, config.GENERATION_TILE_SELECTOR, count, int(wait * 1000),
+                                timeout=wait + 5)
+        return await self.evaluate(TAG_SCRIPT, config.GENERATION_TILE_SELECTOR)
+
+    # Blocking wrappers, so WorkerPool threads can use this like a WhiskSession
+
+    def wait_until_ready(self, timeout):
+        return self.engine.run(self.wait_until_ready_async(timeout))
+
+    def submit(self, row, prompt, timer=None, next_prompt=None):
+        return self.engine.run(self.submit_async(row, prompt, timer, next_prompt))
+
+    def block_urls(self, patterns):
+        """Block requests matching the wildcard patterns in this tab"""
+        self.engine.run(self.connection.send("Network.enable"))
+        self.engine.run(self.connection.send("Network.setBlockedURLs", {"urls": list(patterns)}))
+
+    def screenshot_png(self):
+        """Screenshot of this tab as PNG bytes"""
+        result = self.engine.run(self.connection.send("Page.captureScreenshot", {"format": "png"}))
+        return base64.b64decode(result["data"])
+
+    def memory_usage(self):
+        """JavaScript heap this tab uses in MB, or None if Chrome doesn't report it"""
+        used = self.engine.run(self.evaluate(MEMORY_SCRIPT))
+        return used / (1024 * 1024) if used else None
+
+    def reload(self, timeout):
+        return self.engine.run(self.reload_async(timeout))
+
+    def is_alive(self, timeout=10):
+        """True if this tab still answers a trivial script within timeout seconds"""
+        try:
+            return self.engine.run(self.evaluate("return 1;", timeout=timeout), timeout + 1) == 1
+        except Exception:
+            return False
+
+    def tag_new_images(self, wait=0, count=1):
+        return self.engine.run(self.tag_new_images_async(wait, count))
+
+    def read_image(self, tag):
+        """Read a tagged image from the page as a data: URL"""
+        return self.engine.run(self.evaluate(READ_CALL_SCRIPT, tag))
+
+
+class CdpEngine:
+    """One event loop thread serving every CdpWhiskSession of a Chrome"""
+
+    def __init__(self, address):
+        self.address = address
+        self.sessions = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the engine's loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def open_session(self, url, name=None, reuse=False):
+        """
+        Connect a session to a tab showing url
+
+        With reuse, a tab already showing url that no other session uses is
+        taken over; otherwise a new tab is opened.
+        """
+        target = None
+        if reuse:
+            taken = {session.target["id"] for session in self.sessions}
+            for candidate in list_targets(self.address):
+                if candidate["url"].startswith(url) and candidate["id"] not in taken:
+                    target = candidate
+                    break
+        if target is None:
+            target = open_target(self.address, url)
+
+        session = CdpWhiskSession(self, target, name=name)
+        self.run(session.connect())
+        self.sessions.append(session)
+        return session
+
+    def close(self):
+        """Close every DevTools connection and stop the loop; the tabs stay open"""
+        for session in self.sessions:
+            try:
+                self.run(session.connection.close())
+            except Exception:
+                pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
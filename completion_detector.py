@@ -0,0 +1,176 @@
+"""
+Network-level completion detection for Whisk generations
+
+Watches the DevTools Network events of a Whisk tab for the request that
+generates the images and reports when it returns, with its status and
+latency. The submit cycle waits for that instead of guessing how long a
+generation takes, so the next prompt goes out as soon as Whisk is done.
+
+The Selenium engine reads the events from chromedriver's performance log,
+which is shared by every tab of the browser, so one PerformanceLog drains
+it and hands each event to the tracker of the tab it came from. The CDP
+engine feeds its trackers straight from its Network event subscriptions.
+"""
+
+import json
+import re
+import time
+
+from diagnostics import log
+
+
+# HTTP statuses of the generation request that mean Whisk is overloaded
+OVERLOAD_STATUSES = (429, 503)
+
+# DevTools Network events a tracker needs
+NETWORK_EVENTS = (
+    "Network.requestWillBeSent",
+    "Network.responseReceived",
+    "Network.loadingFinished",
+    "Network.loadingFailed",
+)
+
+
+class CompletionTracker:
+    """Generation requests of one tab, fed with DevTools Network events"""
+
+    def __init__(self, url_pattern):
+        self.url_pattern = re.compile(url_pattern)
+        self.pending = {}
+        self.completed = []
+        self.started = 0
+        # Called with no arguments after every event that changed something
+        self.listeners = []
+
+    def feed(self, method, params):
+        """Take one Network event"""
+        request_id = params.get("requestId")
+        if method == "Network.requestWillBeSent":
+            url = params.get("request", {}).get("url", "")
+            if not self.url_pattern.search(url):
+                return
+            self.started += 1
+            self.pending[request_id] = {
+                "sequence": self.started,
+                "url": url,
+                "started": params.get("timestamp"),
+                "status": None,
+            }
+        elif request_id not in self.pending:
+            return
+        elif method == "Network.responseReceived":
+            self.pending[request_id]["status"] = params.get("response", {}).get("status")
+        elif method in ("Network.loadingFinished", "Network.loadingFailed"):
+            request = self.pending.pop(request_id)
+            latency = None
+            if request["started"] is not None and params.get("timestamp") is not None:
+                latency = round(params["timestamp"] - request["started"], 3)
+            self.completed.append({
+                "sequence": request["sequence"],
+                "url": request["url"],
+                "status": request["status"],
+                "latency": latency,
+                "failed": method == "Network.loadingFailed",
+                "error": params.get("errorText"),
+            })
+            # Only the latest results are ever asked for
+            del self.completed[:-20]
+        else:
+            return
+
+        for listener in self.listeners:
+            listener()
+
+    def mark(self):
+        """Position to look for completions from, taken before a submit"""
+        return self.started
+
+    def completion_since(self, mark):
+        """The first generation request started after mark that has returned, or None"""
+        for completion in self.completed:
+            if completion["sequence"] > mark:
+                return completion
+        return None
+
+    def settle(self, mark, elapsed, start_window, upper_bound):
+        """
+        Decide whether waiting for a generation can end
+
+        Returns (done, completion). Waiting ends when a generation request
+        started after mark has returned, when none started within
+        start_window seconds, or after upper_bound seconds.
+        """
+        completion = self.completion_since(mark)
+        if completion:
+            return True, completion
+        if self.started <= mark and elapsed >= start_window:
+            return True, None
+        return elapsed >= upper_bound, None
+
+
+def is_overload(completion):
+    """True if a generation request returned an overload status"""
+    return bool(completion) and completion["status"] in OVERLOAD_STATUSES
+
+
+def _target_id(handle):
+    """chromedriver window handles are DevTools target ids, on old versions with a prefix"""
+    return handle.replace("CDwindow-", "").upper()
+
+
+class PerformanceLog:
+    """Routes chromedriver's performance log to the trackers of each tab"""
+
+    def __init__(self, driver, lock):
+        self.driver = driver
+        self.lock = lock
+        self.trackers = {}
+        self.available = True
+
+    def register(self, handle, tracker):
+        """Send the Network events of the tab with this window handle to tracker"""
+        self.trackers[_target_id(handle)] = tracker
+
+    def drain(self):
+        """Read every buffered log entry and feed the Network events to their trackers"""
+        if not self.available:
+            return
+        with self.lock:
+            try:
+                entries = self.driver.get_log("performance")
+            except Exception as e:
+                # The driver was started without goog:loggingPrefs
+                log(f"Network completion detection unavailable: {e}")
+                self.available = False
+                return
+
+            for entry in entries:
+                try:
+                    message = json.loads(entry["message"])
+                except (KeyError, ValueError):
+                    continue
+                event = message.get("message", {})
+                if event.get("method") not in NETWORK_EVENTS:
+                    continue
+                tracker = self.trackers.get((message.get("webview") or "").upper())
+                if tracker is None and len(self.trackers) == 1:
+                    tracker = next(iter(self.trackers.values()))
+                if tracker is not None:
+                    tracker.feed(event["method"], event.get("params", {}))
+
+    def wait(self, tracker, mark, start_window, upper_bound, poll_interval=0.05):
+        """
+        Wait for the generation request a submit started
+
+        Returns the completion dict (url, status, latency, failed, error),
+        or None if no request was seen or it did not return in time.
+        """
+        started_at = time.monotonic()
+        while True:
+            self.drain()
+            if not self.available:
+                return None
+            done, completion = tracker.settle(mark, time.monotonic() - started_at, start_window, upper_bound)
+            if done:
+                return completion
+            time.sleep(poll_interval)
@@ -12,17 +12,145 @@ WHISK_URL = "https://labs.google/fx/tools/whisk/project/"
 # Linux/Mac: "/home/YOUR_USERNAME/selenium-automation-profile"
 CHROME_PROFILE_PATH = "./selenium-automation-profile"
 
+# Prompt Source - all prompts are loaded in one bulk read before submission starts
+PROMPT_SOURCE = "export"  # "export" (sheet export URL), "file" (local file) or "dom" (scrape the open sheet)
+PROMPT_FILE = "prompts.csv"  # Used when PROMPT_SOURCE = "file" (.csv, .txt or .xlsx)
+EXPORT_FORMAT = "csv"  # "csv" or "xlsx" (xlsx needs openpyxl and a sheet shared by link)
+
+# Jobs - several sheets, files, tabs, columns or row ranges in one run, on the same browser
+# Jobs run one after another, highest priority first. Leave empty to process
+# column A of GOOGLE_SHEET_URL (or PROMPT_FILE), or pass --jobs FILE with the same list as JSON.
+# Keys: name, sheet_url or file, sheet (tab name), column ("A" or 0), first_row, last_row, priority
+# Example:
+#   JOBS = [
+#       {"name": "cats", "sheet_url": "https://docs.google.com/spreadsheets/d/ID/edit", "sheet": "Tab 2", "column": "B"},
+#       {"name": "urgent", "file": "urgent.xlsx", "first_row": 2, "last_row": 50, "priority": 10},
+#   ]
+JOBS = []
+
 # Automation Settings
 MAX_EMPTY_CELLS = 3  # Stop after this many consecutive empty cells
 WAIT_AFTER_SUBMIT = 2  # Seconds to wait after submitting each prompt
 WAIT_FOR_POPUP = 3  # Seconds to wait if "Please wait" popup appears
+PROMPT_INPUT_SELECTORS = [  # Whisk prompt input, tried in order; the one that works is tried first next time
+    ("xpath", "//input[contains(@placeholder, 'Describe your idea or roll the dice for prompt ideas')]"),
+    ("xpath", "//input[@type='text']"),
+    ("tag name", "textarea")
+]
 SHORT_WAIT = 0.3  # Short wait between actions (seconds)
+INPUT_MODE = "inject"  # "inject" sets the prompt in one script call, "type" sends it key by key
+WAIT_FOR_ACCEPT = 0.5  # Seconds to wait for Whisk to accept a submitted prompt
+POPUP_TEXTS = [  # Text of Whisk's overload popup, most specific first
+    "Please wait. Loading requested images.",
+    "Please wait",
+    "Processing the requested images",
+    "processing"
+]
+
+# Event-driven waits - each step waits only until the page is ready, and the
+# wait values above become upper bounds instead of fixed sleeps
+USE_EVENT_WAITS = True
+WAIT_POLL_INTERVAL = 0.05  # How often readiness conditions are checked (seconds)
+GENERATION_TILE_SELECTOR = "img[src^='blob:'], img[src^='data:image']"  # A new match means generation has started
+
+# Network completion detection - wait until Whisk's generation request returns
+# instead of a fixed time, and use its HTTP status as an overload signal
+DETECT_COMPLETION = True
+GENERATION_URL_PATTERN = r"aisandbox-pa\.googleapis\.com/.*(generateImage|runImageFx)"  # Regex for the generation request URL
+GENERATION_TIMEOUT = 60  # Longest wait for a generation request to return (seconds); WAIT_AFTER_SUBMIT is how long to wait for it to start
+
+# Single tab - the main browser keeps one tab, the Whisk one, and the driver never switches away from it.
+# Prompts are read outside the browser with its Google cookies ("dom" reads the sheet in that tab first).
+# Use WORKER_MODE = "profiles" to keep it with several workers, each in its own Chrome.
+SINGLE_TAB = False
+
+# Parallel Submission
+WORKER_COUNT = 1  # Number of Whisk sessions submitting prompts in parallel
+WORKER_MODE = "tabs"  # "tabs" (Whisk tabs in one Chrome) or "profiles" (one Chrome per worker, each with its own profile copy)
+MAX_IN_FLIGHT = 0  # Max workers submitting at the same time (0 = no limit beyond WORKER_COUNT)
+WORKER_BACKOFF_BASE = 2  # Seconds a worker pauses after an overload popup, doubled while it repeats
+WORKER_BACKOFF_MAX = 60  # Longest pause for a single worker (seconds)
+PIPELINE_PROMPTS = True  # Type the next prompt into Whisk while the current one is still generating
+
+# Coordinator - share the prompts between several machines without submitting a row twice
+# Start `python coordinator.py --host 0.0.0.0` on one machine and point every instance at it
+COORDINATOR_URL = ""  # e.g. "http://127.0.0.1:8765" ("" = this instance submits every prompt itself)
+COORDINATOR_WORKER_ID = ""  # Name of this instance for the coordinator ("" = host name and process id)
+CLAIM_BATCH = 10  # Rows claimed at a time
+LEASE_SECONDS = 120  # A claimed row goes to another instance if its lease is not renewed for this long
+
+# Browser Engine - how the Whisk tabs are driven
+ENGINE = "selenium"  # "selenium" (chromedriver) or "cdp" (asyncio over the DevTools Protocol, needs: pip install websockets)
+
+# Adaptive Rate Control - the overload popup slows submissions down, quiet periods speed them up again
+ADAPTIVE_RATE = True
+RATE_INITIAL = 20  # Starting submission rate (prompts per minute, across all workers)
+RATE_MIN = 4  # Never go slower than this (prompts per minute)
+RATE_MAX = 60  # Never go faster than this (prompts per minute)
+RATE_INCREASE = 1  # Added to the rate for every prompt accepted without the popup
+RATE_DECREASE = 0.5  # Rate is multiplied by this whenever the popup appears
+
+# Crash Recovery - restart the browser when it dies or hangs, and retry prompts that failed with an error
+PROMPT_RETRIES = 2  # Extra attempts for a prompt whose submit raised an error
+HEALTH_CHECK_TIMEOUT = 10  # Seconds the browser gets to answer before it counts as hung
+COMMAND_TIMEOUT = 90  # Longest a single chromedriver command may take before it counts as hung (seconds)
+MAX_BROWSER_RESTARTS = 3  # Restarts per run before giving up (continue later with --resume)
+RESTART_BACKOFF_BASE = 5  # Seconds to wait before the first restart, doubled for every further one
+RESTART_BACKOFF_MAX = 120  # Longest wait before a restart (seconds)
+
+# Resource Policy - keep tabs lean over long runs
+BLOCKED_URLS = [  # Requests no tab ever makes, as wildcard patterns ([] = block nothing)
+    "*fonts.gstatic.com*",
+    "*.woff2",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*"
+]
+MEMORY_CHECK_EVERY = 25  # Check memory after this many prompts per Whisk tab (0 = never)
+TAB_MEMORY_LIMIT_MB = 1024  # Reload a Whisk tab whose JavaScript heap grows past this (0 = no limit)
+BROWSER_MEMORY_LIMIT_MB = 0  # Recycle Chrome when all its processes together use more (needs: pip install psutil, 0 = no limit)
+
+# Progress Journal - every outcome is saved so an interrupted run can continue with --resume
+JOURNAL_FILE = "progress_journal.jsonl"
+
+# Duplicate Prompts - prompts already generated (in this run or earlier runs) are skipped
+DEDUPE_PROMPTS = True
+PROMPT_CACHE_FILE = "prompt_cache.json"
+PROMPT_CACHE_MAX_ENTRIES = 10000  # Least recently seen prompts are forgotten beyond this
+PROMPT_CACHE_MAX_AGE_DAYS = 30  # Forget prompts not seen for this many days (0 = never)
+
+# Metrics - per-stage timing of every prompt, with p50/p95/p99 summaries
+ENABLE_METRICS = True
+METRICS_FILE = "metrics.jsonl"  # One record per prompt, appended as prompts finish
+METRICS_SUMMARY_FILE = "metrics_summary.prom"  # Written at the end of the run
+METRICS_FORMAT = "prometheus"  # "prometheus" (text exposition format) or "json"
+
+# Image Harvesting - save every generated image to disk while prompts are still being submitted
+HARVEST_IMAGES = True
+HARVEST_DIR = "whisk_images"  # Images are saved as row0005_1.png, row0005_2.png, ...
+HARVEST_QUEUE_SIZE = 16  # Prompts waiting for download before submission pauses
+HARVEST_TILE_WAIT = 3  # Seconds to wait for all of a submitted prompt's images to show up
+HARVEST_TILES_PER_PROMPT = 2  # Images Whisk makes per prompt; a prompt's tiles are only tagged once this many are new
 
 # Browser Settings
 START_MAXIMIZED = True  # Open browser in full screen
-HEADLESS = False  # Set to True for background operation (may break clipboard)
+PAGE_LOAD_WAIT = 5  # Max seconds to wait for Sheets and Whisk to finish loading
+HEADLESS = False  # Run Chrome without a window, e.g. on a server; prompts are always injected, never typed
+HEADLESS_WINDOW_SIZE = "1024,768"  # Viewport in headless mode, smaller is cheaper to render
+HEADLESS_DISABLE_IMAGES = False  # Don't load or paint images in headless mode (image harvesting still works)
+
+# Startup - skip the driver check and browser launch on back-to-back runs
+CHROMEDRIVER_PATH = ""  # Use this chromedriver directly and never ask webdriver-manager
+CHROMEDRIVER_VERSION = ""  # Pin a chromedriver version, e.g. "126.0.6478.126" ("" = match installed Chrome)
+DRIVER_CACHE_FILE = ".chromedriver_cache.json"  # Where the resolved chromedriver path is remembered
+DRIVER_CACHE_MAX_AGE_HOURS = 24  # Check for a newer chromedriver after this long (unpinned only)
+REMOTE_DEBUGGING_ADDRESS = ""  # e.g. "127.0.0.1:9222" - attach to a warm Chrome there, launching one if needed
+CHROME_BINARY = ""  # Chrome executable for the warm browser ("" = search the usual install locations)
 
 # Advanced Settings
 ENABLE_LOGGING = False  # Save logs to file
 LOG_FILE = "automation.log"
+LOG_QUEUE_SIZE = 1000  # Messages waiting for the background writer
+LOG_QUEUE_FULL = "drop"  # "drop" new messages or "block" the worker until there is room
 SCREENSHOT_ON_ERROR = False  # Save screenshot when errors occur
+SCREENSHOT_DIR = "error_screenshots"  # Written by a background thread, at most a few waiting at a time
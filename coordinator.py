@@ -0,0 +1,338 @@
+"""
+Shares the prompts of a run between several machines
+
+The coordinator keeps every prompt row in a SQLite database and hands
+them out over HTTP with leases that expire. Each automation instance
+claims a small batch, renews the lease while it works on it and reports
+every outcome, so no two instances submit the same row. Rows whose lease
+runs out because an instance crashed or hung are given to the next
+instance that asks, and so are rows that failed, up to a number of
+attempts. Start it on one machine, or on localhost to try it:
+
+    python coordinator.py --port 8765
+
+and set COORDINATOR_URL in config.py on every machine that submits.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from diagnostics import log
+
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+# Outcomes that hand a row back for another attempt instead of completing it
+RETRY_OUTCOMES = ("failed",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    job TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    outcome TEXT,
+    PRIMARY KEY (job, row)
+)
+"""
+
+
+class LeaseStore:
+    """Prompt rows and their leases in a SQLite database"""
+
+    def __init__(self, path, max_attempts=3):
+        # Rows are no longer handed out once they were claimed this often
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        # One connection serves every request thread
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def add(self, job, prompts):
+        """
+        Add (row, prompt) pairs of a job; returns how many rows are new or changed
+
+        Rows the store already has with the same prompt are left alone, so
+        finished rows are not submitted again. A row whose prompt was
+        edited since is reset to pending with the new text, unless another
+        worker holds a live lease on it.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT INTO prompts (job, row, prompt) VALUES (?, ?, ?) "
+                "ON CONFLICT (job, row) DO UPDATE SET prompt = excluded.prompt, state = ?, worker = NULL, "
+                "lease_expires = NULL, attempts = 0, outcome = NULL "
+                "WHERE prompts.prompt != excluded.prompt AND NOT (prompts.state = ? AND prompts.lease_expires >= ?)",
+                [(job, row, prompt, PENDING, LEASED, now) for row, prompt in prompts]
+            )
+            return db.total_changes - before
+
+    def claim(self, worker, job, count, lease_seconds):
+        """
+        Lease up to count rows of a job to worker
+
+        Pending rows come first, in row order, together with rows whose
+        lease has expired, as long as they have attempts left. Returns (rows, leased), where leased is the
+        number of rows other workers still hold.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT row, prompt FROM prompts WHERE job = ? AND attempts < ? "
+                "AND (state = ? OR (state = ? AND lease_expires < ?)) ORDER BY row LIMIT ?",
+                (job, self.max_attempts, PENDING, LEASED, now, count)
+            ).fetchall()
+            db.executemany(
+                "UPDATE prompts SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE job = ? AND row = ?",
+                [(LEASED, worker, now + lease_seconds, job, row) for row, _ in rows]
+            )
+            leased = db.execute(
+                "SELECT COUNT(*) FROM prompts WHERE job = ? AND state = ? AND worker != ? AND lease_expires >= ?",
+                (job, LEASED, worker, now)
+            ).fetchone()[0]
+        return [list(row) for row in rows], leased
+
+    def heartbeat(self, worker, job, rows, lease_seconds):
+        """Extend the leases worker still holds on rows; returns how many were extended"""
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "UPDATE prompts SET lease_expires = ? WHERE job = ? AND row = ? AND state = ? AND worker = ?",
+                [(time.time() + lease_seconds, job, row, LEASED, worker) for row in rows]
+            )
+            return db.total_changes - before
+
+    def complete(self, worker, job, row, outcome):
+        """
+        Record the outcome of a leased row, even if its lease expired in the meantime
+
+        A row that was reset because its prompt changed stays pending.
+        """
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE prompts SET state = ?, worker = ?, outcome = ?, lease_expires = NULL "
+                "WHERE job = ? AND row = ? AND state = ?",
+                (DONE, worker, outcome, job, row, LEASED)
+            )
+
+    def release(self, worker, job, row, outcome):
+        """Hand a row worker still holds back for another attempt, keeping its latest outcome"""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE prompts SET state = ?, worker = NULL, outcome = ?, lease_expires = NULL "
+                "WHERE job = ? AND row = ? AND state = ? AND worker = ?",
+                (PENDING, outcome, job, row, LEASED, worker)
+            )
+
+    def status(self):
+        """Row counts per job and state"""
+        with self.lock:
+            counts = self.connection.execute(
+                "SELECT job, state, COUNT(*) FROM prompts GROUP BY job, state"
+            ).fetchall()
+        status = {}
+        for job, state, count in counts:
+            status.setdefault(job, {})[state] = count
+        return status
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    """JSON endpoints: POST /add, /claim, /heartbeat, /complete, /release and GET /status"""
+
+    store = None
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(200, self.store.status())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/add":
+                self._reply(200, {"added": self.store.add(body["job"], body["prompts"])})
+            elif self.path == "/claim":
+                rows, leased = self.store.claim(body["worker"], body["job"], body["count"], body["lease_seconds"])
+                self._reply(200, {"rows": rows, "leased": leased})
+            elif self.path == "/heartbeat":
+                renewed = self.store.heartbeat(body["worker"], body["job"], body["rows"], body["lease_seconds"])
+                self._reply(200, {"renewed": renewed})
+            elif self.path == "/complete":
+                self.store.complete(body["worker"], body["job"], body["row"], body["outcome"])
+                self._reply(200, {"ok": True})
+            elif self.path == "/release":
+                self.store.release(body["worker"], body["job"], body["row"], body["outcome"])
+                self._reply(200, {"ok": True})
+            else:
+                self._reply(404, {"error": "not found"})
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        # Claims and heartbeats would flood the console
+        pass
+
+
+def serve(host, port, db_path, max_attempts=3):
+    """Run the coordinator until interrupted"""
+    handler = type("Handler", (CoordinatorHandler,), {"store": LeaseStore(db_path, max_attempts)})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Coordinator listening on http://{host}:{port} (database: {db_path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class CoordinatorClient:
+    """Claims, renews and completes prompt rows on a coordinator"""
+
+    def __init__(self, url, worker=None, lease_seconds=120, timeout=10):
+        self.url = url.rstrip("/")
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def add(self, job, prompts):
+        """Offer a job's (row, prompt) pairs; every instance can do this, unchanged rows are only added once"""
+        return self._post("/add", {"job": job, "prompts": [[row, prompt] for row, prompt in prompts]})["added"]
+
+    def claim(self, job, count):
+        """Lease up to count rows; returns ([(row, prompt)], rows other instances hold)"""
+        reply = self._post("/claim", {
+            "worker": self.worker, "job": job, "count": count, "lease_seconds": self.lease_seconds
+        })
+        return [tuple(row) for row in reply["rows"]], reply["leased"]
+
+    def heartbeat(self, job, rows):
+        return self._post("/heartbeat", {
+            "worker": self.worker, "job": job, "rows": list(rows), "lease_seconds": self.lease_seconds
+        })["renewed"]
+
+    def complete(self, job, row, outcome):
+        self._post("/complete", {"worker": self.worker, "job": job, "row": row, "outcome": outcome})
+
+    def release(self, job, row, outcome):
+        self._post("/release", {"worker": self.worker, "job": job, "row": row, "outcome": outcome})
+
+    @contextmanager
+    def leased(self, job, batch):
+        """Renew the leases on a batch in the background while the block runs"""
+        stop = threading.Event()
+        rows = [row for row, _ in batch]
+
+        def renew():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.heartbeat(job, rows)
+                except Exception as e:
+                    log(f"Could not renew leases with the coordinator: {e}")
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def batches(self, job, count, poll_interval=10):
+        """
+        Yield batches of leased (row, prompt) pairs until the job is done
+
+        When nothing is left to claim but other instances still hold
+        leases, keeps asking, so rows of an instance that died are picked up
+        once their lease expires.
+        """
+        while True:
+            batch, leased = self.claim(job, count)
+            if batch:
+                yield batch
+            elif leased:
+                time.sleep(poll_interval)
+            else:
+                return
+
+
+class LeaseReporter:
+    """Reports the outcome of every prompt of one job to the coordinator"""
+
+    def __init__(self, client, job):
+        self.client = client
+        self.job = job
+
+    def record(self, row, outcome):
+        try:
+            if outcome in RETRY_OUTCOMES:
+                # Another instance, or this one, gets to try the row again
+                self.client.release(self.job, row, outcome)
+            else:
+                self.client.complete(self.job, row, outcome)
+        except Exception as e:
+            # The lease runs out and the row is submitted again elsewhere
+            log(f"Could not report row {row} to the coordinator: {e}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hand out prompt rows to several automation instances")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (0.0.0.0 for other machines)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="coordinator.sqlite", help="SQLite database with the rows and their leases")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="times a row is handed out before it is given up on")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(args.host, args.port, args.db, args.max_attempts)
@@ -0,0 +1,175 @@
+"""
+Logging and error screenshots that stay off the submission path
+
+Workers never write to the console or to disk themselves. Their messages
+go to a bounded queue that a background thread drains into the console
+and, with ENABLE_LOGGING, into LOG_FILE. Error screenshots are captured
+as raw PNG bytes and handed to a second thread that recompresses and
+writes them. When a queue is full, a message is either dropped or the
+worker waits for room, as configured; screenshots are always dropped.
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+
+logger = logging.getLogger("autometion")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def log(message):
+    """Log a message through the background writer, or print it when none is running"""
+    if logger.handlers:
+        logger.info(message)
+    else:
+        print(message)
+
+
+def recompress_png(data, level=9):
+    """
+    Rewrite a PNG with its image data compressed at the given zlib level
+
+    Chrome favours speed over size when it encodes screenshots. The pixels
+    and every other chunk stay as they are. Data that isn't a PNG is
+    returned unchanged.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+
+    chunks = []
+    image_data = []
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == b"IDAT":
+            if not image_data:
+                chunks.append(None)  # Where the image data goes back in
+            image_data.append(body)
+        else:
+            chunks.append((kind, body))
+
+    if not image_data:
+        return data
+    compressed = zlib.compress(zlib.decompress(b"".join(image_data)), level)
+
+    output = [PNG_SIGNATURE]
+    for chunk in chunks:
+        kind, body = chunk or (b"IDAT", compressed)
+        output.append(struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body)))
+    return b"".join(output)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records or waits for room when its queue is full"""
+
+    def __init__(self, record_queue, block=False):
+        super().__init__(record_queue)
+        self.block = block
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Diagnostics:
+    """Background writers for log records and error screenshots"""
+
+    def __init__(self, log_file=None, queue_size=1000, block=False,
+                 screenshot_dir=None, screenshot_queue_size=4):
+        self.records = queue.Queue(queue_size)
+        self.handler = BoundedQueueHandler(self.records, block=block)
+        console = logging.StreamHandler(sys.stdout)
+        handlers = [console]
+        if log_file:
+            file_handler = logging.FileHandler(log_file, encoding="utf-8")
+            file_handler.setFormatter(logging.Formatter("%(asctime)s %(threadName)s %(message)s"))
+            handlers.append(file_handler)
+        self.listener = logging.handlers.QueueListener(self.records, *handlers)
+
+        # Screenshots are only taken with a directory to write them to
+        self.screenshot_dir = screenshot_dir
+        self.screenshots = queue.Queue(screenshot_queue_size)
+        self.screenshot_thread = threading.Thread(target=self._write_screenshots, daemon=True)
+        self.screenshots_saved = 0
+        self.screenshots_dropped = 0
+
+    def start(self):
+        """Route log() through the writer thread and start the screenshot writer"""
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(self.handler)
+        self.listener.start()
+        if self.screenshot_dir:
+            os.makedirs(self.screenshot_dir, exist_ok=True)
+            self.screenshot_thread.start()
+
+    def screenshot(self, session, name):
+        """
+        Capture a session's tab for an error and queue it to be written
+
+        Only the capture itself runs on the caller's thread. Nothing is
+        captured while the queue is full.
+        """
+        if not self.screenshot_dir:
+            return
+        if self.screenshots.full():
+            self.screenshots_dropped += 1
+            return
+        try:
+            data = session.screenshot_png()
+        except Exception as e:
+            session.log(f"Could not take a screenshot: {e}")
+            return
+        try:
+            self.screenshots.put_nowait((name, data))
+        except queue.Full:
+            self.screenshots_dropped += 1
+
+    def _write_screenshots(self):
+        while True:
+            item = self.screenshots.get()
+            if item is None:
+                self.screenshots.task_done()
+                return
+            name, data = item
+            path = os.path.join(self.screenshot_dir, f"error_{time.strftime('%Y%m%d-%H%M%S')}_{name}.png")
+            try:
+                with open(path, "wb") as f:
+                    f.write(recompress_png(data))
+                self.screenshots_saved += 1
+            except Exception as e:
+                log(f"Could not save screenshot {path}: {e}")
+            self.screenshots.task_done()
+
+    def flush(self):
+        """Wait until every queued message has been written"""
+        self.records.join()
+
+    def close(self):
+        """Write what is queued, stop both threads and send later messages straight to the console"""
+        if self.screenshot_thread.is_alive():
+            self.screenshots.put(None)
+            self.screenshot_thread.join()
+        if self.handler in logger.handlers:
+            logger.removeHandler(self.handler)
+            # Make room for the listener's stop marker
+            self.flush()
+            self.listener.stop()
+            if self.handler.dropped:
+                print(f"{self.handler.dropped} log messages were dropped because the log queue was full")
@@ -0,0 +1,151 @@
+"""
+Saves every generated Whisk image to disk while the run goes on
+
+After a prompt is submitted, its session tags the image tiles that showed
+up for it, which is cheap and keeps each image tied to its sheet row. A
+background thread then reads the tagged images one at a time straight
+from the page (blob: URLs are fetched in the page, data: URLs read as
+they are) and writes them under a row-based filename. Only a bounded
+number of prompts can wait for download, and only one image is held in
+memory at a time, so a long run never piles images up.
+"""
+
+import base64
+import os
+import queue
+import threading
+
+
+# Tags the generation tiles that have no tag yet and returns the new tags;
+# arguments: tileSelector
+TAG_SCRIPT = """
+var tiles = document.querySelectorAll(arguments[0]);
+var tags = [];
+window.__autometionHarvested = window.__autometionHarvested || 0;
+for (var i = 0; i < tiles.length; i++) {
+    if (!tiles[i].hasAttribute('data-autometion-harvest')) {
+        window.__autometionHarvested += 1;
+        tiles[i].setAttribute('data-autometion-harvest', String(window.__autometionHarvested));
+        tags.push(String(window.__autometionHarvested));
+    }
+}
+return tags;
+"""
+
+# Number of generation tiles without a tag; arguments: tileSelector
+UNTAGGED_SCRIPT = """
+var tiles = document.querySelectorAll(arguments[0]);
+var count = 0;
+for (var i = 0; i < tiles.length; i++) {
+    if (!tiles[i].hasAttribute('data-autometion-harvest')) { count += 1; }
+}
+return count;
+"""
+
+# Reads one tagged image as a data: URL, or null if it is gone;
+# arguments: tag, callback
+READ_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var image = document.querySelector('img[data-autometion-harvest="' + arguments[0] + '"]');
+if (!image) { done(null); return; }
+
+var source = image.currentSrc || image.src;
+if (source.indexOf('data:') === 0) { done(source); return; }
+
+fetch(source).then(function (response) {
+    return response.blob();
+}).then(function (blob) {
+    var reader = new FileReader();
+    reader.onload = function () { done(reader.result); };
+    reader.onerror = function () { done(null); };
+    reader.readAsDataURL(blob);
+}).catch(function () { done(null); });
+"""
+
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+
+def decode_data_url(data_url):
+    """Split a base64 data: URL into (mime type, bytes)"""
+    header, _, payload = data_url.partition(",")
+    mime = header[len("data:"):].split(";")[0] or "application/octet-stream"
+    return mime, base64.b64decode(payload)
+
+
+class ImageHarvester:
+    """Background thread that downloads tagged images and writes them to disk"""
+
+    def __init__(self, directory, max_pending=16, tile_wait=3, tiles_per_prompt=2):
+        self.directory = directory
+        # Seconds a session waits for a submitted prompt's tiles to show up
+        self.tile_wait = tile_wait
+        # New tiles a session waits for before tagging, so no late image of
+        # a prompt is left behind for the next row
+        self.tiles_per_prompt = tiles_per_prompt
+        self.jobs = queue.Queue(max_pending)
+        self.saved = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread.start()
+
+    def set_directory(self, directory):
+        """Save the images of later prompts to another directory, once the queued ones are saved"""
+        self.wait_idle()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, session, row, tags):
+        """
+        Queue the tagged images of a row for download
+
+        Blocks while the queue is full, so submission can never run far
+        ahead of the downloads.
+        """
+        if tags:
+            self.jobs.put((session, row, tags))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            session, row, tags = job
+            for index, tag in enumerate(tags, start=1):
+                try:
+                    data_url = session.read_image(tag)
+                    if not data_url:
+                        raise ValueError("image is no longer on the page")
+                    self._save(row, index, *decode_data_url(data_url))
+                except Exception as e:
+                    self.failed += 1
+                    session.log(f"Could not save image {index} of row {row}: {e}")
+            self.jobs.task_done()
+
+    def _save(self, row, index, mime, data):
+        """Write one image, through a temporary file so no half-written image is left behind"""
+        path = os.path.join(self.directory, f"row{row:04d}_{index}.{EXTENSIONS.get(mime, 'img')}")
+        temp_path = path + ".part"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self.saved += 1
+
+    def wait_idle(self):
+        """Block until every queued image has been saved"""
+        if self.thread.is_alive():
+            self.jobs.join()
+
+    def close(self):
+        """Finish every queued download and stop the thread"""
+        if self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join()
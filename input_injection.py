@@ -0,0 +1,38 @@
+"""
+Direct value injection for the Whisk prompt input
+
+Sets the input's value in a single execute_script call instead of typing
+it one key event at a time, so entering a prompt costs the same no
+matter how long it is. The value is set through the native setter and
+followed by the input/change events, which is what frameworks like React
+listen for; a plain element.value assignment would be ignored by them.
+"""
+
+
+# Sets the value, fires the events and reports the value the input holds
+# once the app has had a chance to react to them
+INJECT_SCRIPT = """
+var element = arguments[0];
+var value = arguments[1];
+var done = arguments[arguments.length - 1];
+
+var prototype = element.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+var setter = Object.getOwnPropertyDescriptor(prototype, 'value').set;
+
+element.focus();
+setter.call(element, value);
+element.dispatchEvent(new Event('input', {bubbles: true}));
+element.dispatchEvent(new Event('change', {bubbles: true}));
+
+Promise.resolve().then(function () { done(element.value); });
+"""
+
+
+def inject_value(driver, element, text):
+    """
+    Set the input's value to text in one round trip
+
+    Returns True if the input still holds exactly that text after the app
+    processed the events, False if the app rejected or rewrote it.
+    """
+    return driver.execute_async_script(INJECT_SCRIPT, element, text) == text
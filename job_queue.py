@@ -0,0 +1,154 @@
+"""
+Batches of prompt jobs for one run
+
+A job is one column of prompts: a sheet URL or local file, an optional
+sheet tab, a column and a range of rows. Many jobs can be queued at once;
+they run one after another, highest priority first, on the browser and
+Whisk sessions that are already open, so a new sheet never costs another
+Chrome startup. Every worker takes part in every job, and each job keeps
+its own progress, journal entries and image folder.
+"""
+
+import heapq
+import json
+import re
+import threading
+
+from diagnostics import log
+from prompt_source import column_index, load_prompts
+from whisk_session import DUPLICATE, FAILED, OVERLOADED, SUBMITTED
+
+
+class Job:
+    """One column of prompts and its progress"""
+
+    def __init__(self, name=None, sheet_url=None, prompt_file=None, sheet_name=None,
+                 column="A", first_row=1, last_row=None, priority=0):
+        if not (sheet_url or prompt_file):
+            raise ValueError("Every job needs a sheet_url or a file")
+        if first_row < 1 or (last_row is not None and last_row < first_row):
+            raise ValueError(f"Job {name}: bad row range {first_row}-{last_row}")
+        # Used in messages, the progress journal and the image folder; None for the default job
+        self.name = name
+        self.sheet_url = sheet_url
+        self.prompt_file = prompt_file
+        self.sheet_name = sheet_name
+        self.column = column_index(column)
+        self.first_row = first_row
+        self.last_row = last_row
+        self.priority = priority
+        self.prompts = []
+        self.counts = {SUBMITTED: 0, OVERLOADED: 0, DUPLICATE: 0, FAILED: 0}
+        self.done = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, spec, index=0):
+        """Build a job from a JOBS entry or a jobs file entry"""
+        spec = dict(spec)
+        spec.setdefault("name", f"job{index + 1}")
+        if "file" in spec:
+            spec["prompt_file"] = spec.pop("file")
+        if "sheet" in spec:
+            spec["sheet_name"] = spec.pop("sheet")
+        return cls(**spec)
+
+    @property
+    def label(self):
+        return self.name or "prompts"
+
+    @property
+    def key(self):
+        """Where the prompts come from; the coordinator keeps rows of different sources apart by it"""
+        return "|".join(str(part) for part in (self.sheet_url or self.prompt_file, self.sheet_name or "", self.column))
+
+    @property
+    def folder(self):
+        """Name usable as a directory, empty for the default job"""
+        return re.sub(r"[^\w.-]+", "_", self.name) if self.name else ""
+
+    def load(self, source, driver=None, max_empty_cells=3, export_format="csv", cookies=None):
+        """Read the job's prompts; a job with a file always reads the file"""
+        if self.prompt_file:
+            source = "file"
+        elif source == "file":
+            source = "export"
+        self.prompts = load_prompts(
+            source,
+            sheet_url=self.sheet_url,
+            prompt_file=self.prompt_file,
+            driver=driver,
+            column=self.column,
+            max_empty_cells=max_empty_cells,
+            export_format=export_format,
+            sheet_name=self.sheet_name,
+            first_row=self.first_row,
+            last_row=self.last_row,
+            cookies=cookies
+        )
+        return self.prompts
+
+    def record(self, row, outcome):
+        """Count the outcome of one prompt and print progress now and then"""
+        with self._lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+            self.done += 1
+            done = self.done
+        total = len(self.prompts)
+        if done % 10 == 0 or done == total:
+            percent = 100 * done / total if total else 100
+            log(f"📋 {self.label}: {done}/{total} prompts done ({percent:.0f}%)")
+
+    def summary(self):
+        return (f"{self.label}: {self.done}/{len(self.prompts)} done, "
+                f"{self.counts[SUBMITTED]} submitted, {self.counts[OVERLOADED]} overloaded, "
+                f"{self.counts[DUPLICATE]} duplicates, {self.counts[FAILED]} failed")
+
+
+class JobQueue:
+    """Jobs waiting to run, highest priority first and in the order added otherwise"""
+
+    def __init__(self, jobs=()):
+        self._heap = []
+        self._added = 0
+        self.jobs = []
+        for job in jobs:
+            self.add(job)
+
+    def add(self, job):
+        heapq.heappush(self._heap, (-job.priority, self._added, job))
+        self._added += 1
+        self.jobs.append(job)
+
+    def ordered(self):
+        """Every queued job in the order they will run"""
+        return [job for _, _, job in sorted(self._heap)]
+
+    def next_job(self):
+        """Take the next job to run, or None when the queue is empty"""
+        if not self._heap:
+            return None
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def load_jobs(specs=None, jobs_file=None, sheet_url=None, prompt_file=None, source="export"):
+    """
+    Build the job queue from a jobs file, the JOBS setting, or the default job
+
+    Without any job specs, the queue holds a single unnamed job for column
+    A of sheet_url (or prompt_file with the "file" source), like a run
+    without jobs always did.
+    """
+    if jobs_file:
+        with open(jobs_file, "r", encoding="utf-8") as f:
+            specs = json.load(f)
+
+    if specs:
+        return JobQueue(Job.from_dict(spec, index) for index, spec in enumerate(specs))
+
+    if source == "file":
+        return JobQueue([Job(prompt_file=prompt_file)])
+    return JobQueue([Job(sheet_url=sheet_url)])
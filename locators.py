@@ -0,0 +1,77 @@
+"""
+Cached element locators with stale-element recovery
+
+Each UI element is registered once with its chain of fallback selectors.
+The first lookup walks the chain, caches the WebElement and remembers
+which selector worked, so later lookups try that one first. The cached
+element is only looked up again when Selenium reports it as stale.
+"""
+
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+
+
+class LocatorRegistry:
+    """Resolves named elements once and re-resolves them when they go stale"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._selectors = {}
+        self._elements = {}
+        self._preferred = {}
+
+    def register(self, name, selectors):
+        """Register an element by name with a list of (by, value) fallbacks"""
+        self._selectors[name] = list(selectors)
+        self._elements.pop(name, None)
+        self._preferred.pop(name, None)
+
+    def invalidate(self, name=None):
+        """Drop one cached element, or all of them after a page reload"""
+        if name is None:
+            self._elements.clear()
+        else:
+            self._elements.pop(name, None)
+
+    def resolve(self, name):
+        """Look the element up again, trying the selector that worked last time first"""
+        selectors = self._selectors[name]
+        preferred = self._preferred.get(name)
+        order = list(range(len(selectors)))
+        if preferred is not None:
+            order.remove(preferred)
+            order.insert(0, preferred)
+
+        for index in order:
+            by, value = selectors[index]
+            try:
+                element = self.driver.find_element(by, value)
+            except NoSuchElementException:
+                continue
+            self._elements[name] = element
+            self._preferred[name] = index
+            return element
+
+        self._elements.pop(name, None)
+        raise NoSuchElementException(f"No selector matched '{name}'")
+
+    def get(self, name):
+        """Return the cached element, resolving it on first use"""
+        element = self._elements.get(name)
+        if element is None:
+            element = self.resolve(name)
+        return element
+
+    def act(self, name, action):
+        """
+        Run action(element) on the named element
+
+        If the cached element has gone stale, it is resolved again and the
+        action retried once. Returns the element the action ran on.
+        """
+        element = self.get(name)
+        try:
+            action(element)
+        except StaleElementReferenceException:
+            element = self.resolve(name)
+            action(element)
+        return element
@@ -0,0 +1,173 @@
+"""
+Per-stage latency metrics for the submit cycle
+
+Every prompt gets a PromptTimer that records how long each stage took
+(tab switch, input locate, clear, type, submit, popup check, wait, ...).
+Finished prompts are written to a JSONL file as they complete, and at the
+end of a run a summary with p50/p95/p99 per stage is written as JSON or in
+the Prometheus text format.
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+class PromptTimer:
+    """Stage timings for one prompt"""
+
+    def __init__(self, row):
+        self.row = row
+        self.started_at = time.time()
+        self.stages = {}
+        # Extra per-prompt facts written with the record, such as the generation request
+        self.details = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block and add it to the named stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+class MetricsRecorder:
+    """Collects PromptTimers and exports records and summaries"""
+
+    def __init__(self, records_path=None):
+        self.records_path = records_path
+        self.records = []
+        self.run_stages = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._file = open(records_path, "a", encoding="utf-8") if records_path else None
+
+    def finish(self, timer, outcome, **extra):
+        """Record a finished prompt and append it to the records file"""
+        record = {
+            "row": timer.row,
+            "started_at": round(timer.started_at, 3),
+            "outcome": outcome,
+            "total": round(sum(timer.stages.values()), 4),
+            "stages": {name: round(seconds, 4) for name, seconds in timer.stages.items()},
+        }
+        record.update(timer.details)
+        record.update(extra)
+        with self._lock:
+            self.records.append(record)
+            if self._file:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+
+    def record_run_stage(self, name, seconds):
+        """Record a once-per-run stage, such as loading the prompts"""
+        with self._lock:
+            self.run_stages[name] = self.run_stages.get(name, 0.0) + seconds
+
+    def summary(self):
+        """Counts, throughput and per-stage percentiles for the run so far"""
+        with self._lock:
+            records = list(self.records)
+            run_stages = dict(self.run_stages)
+
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        outcomes = {}
+        stage_values = {}
+        for record in records:
+            outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+            for name, seconds in list(record["stages"].items()) + [("total", record["total"])]:
+                stage_values.setdefault(name, []).append(seconds)
+
+        stages = {}
+        for name, values in stage_values.items():
+            stages[name] = {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 4),
+                "p50": round(percentile(values, 0.50), 4),
+                "p95": round(percentile(values, 0.95), 4),
+                "p99": round(percentile(values, 0.99), 4),
+            }
+
+        return {
+            "prompts": len(records),
+            "elapsed": round(elapsed, 3),
+            "prompts_per_second": round(len(records) / elapsed, 4),
+            "outcomes": outcomes,
+            "run_stages": {name: round(seconds, 4) for name, seconds in run_stages.items()},
+            "stages": stages,
+        }
+
+    def prometheus_text(self, extra_gauges=None):
+        """Render the summary in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = [
+            "# HELP whisk_prompts_total Prompts processed, by outcome",
+            "# TYPE whisk_prompts_total counter",
+        ]
+        for outcome, count in sorted(summary["outcomes"].items()):
+            lines.append(f'whisk_prompts_total{{outcome="{outcome}"}} {count}')
+
+        lines += [
+            "# HELP whisk_prompts_per_second Prompt throughput over the run",
+            "# TYPE whisk_prompts_per_second gauge",
+            f"whisk_prompts_per_second {summary['prompts_per_second']}",
+            "# HELP whisk_stage_seconds Per-prompt stage latency",
+            "# TYPE whisk_stage_seconds summary",
+        ]
+        for name, stats in sorted(summary["stages"].items()):
+            for quantile in ("p50", "p95", "p99"):
+                lines.append(f'whisk_stage_seconds{{stage="{name}",quantile="0.{quantile[1:]}"}} {stats[quantile]}')
+            lines.append(f'whisk_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+            lines.append(f'whisk_stage_seconds_sum{{stage="{name}"}} {round(stats["mean"] * stats["count"], 4)}')
+
+        lines += [
+            "# HELP whisk_run_stage_seconds Once-per-run stage duration",
+            "# TYPE whisk_run_stage_seconds gauge",
+        ]
+        for name, seconds in sorted(summary["run_stages"].items()):
+            lines.append(f'whisk_run_stage_seconds{{stage="{name}"}} {seconds}')
+
+        for name, value in sorted((extra_gauges or {}).items()):
+            lines.append(f"# TYPE whisk_{name} gauge")
+            lines.append(f"whisk_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, path, fmt="prometheus", extra_gauges=None):
+        """Write the summary to path as Prometheus text or JSON"""
+        if fmt == "json":
+            summary = self.summary()
+            summary.update(extra_gauges or {})
+            text = json.dumps(summary, indent=2)
+        else:
+            text = self.prometheus_text(extra_gauges)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def print_summary(self):
+        """Print a short per-stage latency table"""
+        summary = self.summary()
+        print(f"\n--- Stage latency over {summary['prompts']} prompts "
+              f"({summary['prompts_per_second']:.3f} prompts/s) ---")
+        for name, seconds in summary["run_stages"].items():
+            print(f"   {name:<14} {seconds:8.3f}s (once)")
+        for name, stats in summary["stages"].items():
+            print(f"   {name:<14} p50 {stats['p50']:7.3f}s   p95 {stats['p95']:7.3f}s   p99 {stats['p99']:7.3f}s")
+
+    def close(self):
+        """Close the records file"""
+        if self._file:
+            self._file.close()
+            self._file = None
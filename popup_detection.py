@@ -0,0 +1,100 @@
+"""
+Overload popup detection for Whisk
+
+Checks every "Please wait" popup signature in a single execute_script
+call instead of one XPath lookup per signature. The popup element is
+cached, both in the page and here, so it can be polled cheaply while
+waiting for it to go away.
+"""
+
+import time
+
+from selenium.common.exceptions import StaleElementReferenceException
+
+
+# Searches visible text nodes for the signatures, most specific first, and
+# re-uses the element found last time while it is still on screen
+DETECT_SCRIPT = """
+var signatures = arguments[0];
+
+function visible(el) {
+    if (!el || !el.isConnected) { return false; }
+    var style = window.getComputedStyle(el);
+    if (style.display === 'none' || style.visibility === 'hidden') { return false; }
+    var rect = el.getBoundingClientRect();
+    return rect.width > 0 && rect.height > 0;
+}
+
+function matching(text) {
+    for (var i = 0; i < signatures.length; i++) {
+        if (text.indexOf(signatures[i]) !== -1) { return signatures[i]; }
+    }
+    return null;
+}
+
+function result(el, signature, cached) {
+    var rect = el.getBoundingClientRect();
+    return {
+        element: el,
+        signature: signature,
+        text: (el.textContent || '').trim().slice(0, 200),
+        rect: {x: rect.x, y: rect.y, width: rect.width, height: rect.height},
+        cached: cached
+    };
+}
+
+var popup = window.__autometionPopup;
+if (visible(popup)) {
+    var signature = matching(popup.textContent || '');
+    if (signature) { return result(popup, signature, true); }
+}
+window.__autometionPopup = null;
+
+var walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+var node;
+while ((node = walker.nextNode())) {
+    var signature = matching(node.nodeValue || '');
+    if (signature && visible(node.parentElement)) {
+        window.__autometionPopup = node.parentElement;
+        return result(node.parentElement, signature, false);
+    }
+}
+return null;
+"""
+
+
+class OverloadDetector:
+    """Finds and tracks Whisk's overload popup"""
+
+    def __init__(self, driver, signatures):
+        self.driver = driver
+        self.signatures = list(signatures)
+        self.element = None
+
+    def detect(self):
+        """
+        Look for the popup in one round trip
+
+        Returns None when no popup is showing, otherwise a dict with the
+        matched signature, the popup text, its on-screen rect, the time it
+        was detected and the popup element itself.
+        """
+        found = self.driver.execute_script(DETECT_SCRIPT, self.signatures)
+        if not found:
+            self.element = None
+            return None
+
+        found["detected_at"] = time.time()
+        self.element = found["element"]
+        return found
+
+    def is_showing(self):
+        """Cheap check on the cached popup, falling back to a full detect"""
+        if self.element is None:
+            return self.detect() is not None
+
+        try:
+            return self.element.is_displayed()
+        except StaleElementReferenceException:
+            # The popup was re-rendered or removed, look for it again
+            return self.detect() is not None
@@ -0,0 +1,105 @@
+"""
+Persistent progress journal for resumable runs
+
+Every submit outcome is appended to a JSONL file as soon as it happens:
+the row, a hash of the prompt text, the submission time and the outcome.
+A run started with --resume reads the journal back and skips prompts the
+previous run already completed, so a crash or Ctrl+C doesn't mean
+starting again from A1. When a run has several jobs, every record carries
+its job name and each job resumes from its own records.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+# Outcomes that mean the prompt reached Whisk and must not be sent again
+COMPLETED_OUTCOMES = ("submitted", "overloaded", "duplicate")
+
+
+def prompt_hash(prompt):
+    """Short, stable hash of a prompt's exact text"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class ProgressJournal:
+    """Append-only JSONL journal of submit outcomes"""
+
+    def __init__(self, path, job=None, lock=None):
+        self.path = path
+        # Job name written to and matched against every record, None without jobs
+        self.job = job
+        self._lock = lock or threading.Lock()
+        self._end_partial_line()
+
+    def for_job(self, job):
+        """Journal of one job, writing to the same file"""
+        return ProgressJournal(self.path, job=job, lock=self._lock)
+
+    def _end_partial_line(self):
+        """Terminate a line left half-written by a crash so new records stay readable"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _append(self, record):
+        """Write one record and flush it to disk right away"""
+        if self.job is not None:
+            record["job"] = self.job
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def start_run(self, source, total):
+        """Mark the start of a fresh run; resume ignores everything before it"""
+        self._append({"event": "start", "source": source, "total": total, "started_at": time.time()})
+
+    def record(self, row, prompt, outcome):
+        """Record the outcome of one prompt"""
+        self._append({
+            "event": "prompt",
+            "row": row,
+            "prompt_hash": prompt_hash(prompt),
+            "submitted_at": time.time(),
+            "outcome": outcome,
+        })
+
+    def completed(self):
+        """
+        Set of (row, prompt_hash) pairs completed since the last run start
+
+        Only records of this journal's job count, and only its own start.
+        A truncated last line from a crash mid-write is ignored.
+        """
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record.get("job") != self.job:
+                    continue
+                if record.get("event") == "start":
+                    done = set()
+                elif record.get("event") == "prompt" and record.get("outcome") in COMPLETED_OUTCOMES:
+                    done.add((record["row"], record["prompt_hash"]))
+        return done
+
+    def remaining(self, prompts):
+        """Filter (row, prompt) pairs down to the ones not completed yet"""
+        done = self.completed()
+        return [(row, prompt) for row, prompt in prompts if (row, prompt_hash(prompt)) not in done]
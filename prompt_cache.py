@@ -0,0 +1,115 @@
+"""
+Content-addressed cache of prompts already generated
+
+Prompts are keyed by a hash of their normalized text (case, whitespace
+and trailing punctuation don't matter), so repeated or near-identical
+rows are only sent to Whisk once, within a run and across runs. The cache
+is kept in a JSON file and evicts entries by age and by count.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+
+def normalize_prompt(prompt):
+    """Normalize prompt text so trivially different copies compare equal"""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(".!,;: ")
+
+
+def cache_key(prompt):
+    """Cache key for a prompt: hash of its normalized text"""
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """Which prompts were already generated, with size and age eviction"""
+
+    def __init__(self, path, max_entries=10000, max_age_days=30, save_every=25):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.save_every = save_every
+        self._entries = {}
+        self._pending = set()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the cache file, dropping expired entries"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read prompt cache, starting empty: {e}")
+            self._entries = {}
+        with self._lock:
+            self._evict()
+
+    def save(self):
+        """Write the cache file atomically"""
+        with self._lock:
+            data = json.dumps(self._entries, ensure_ascii=False)
+            self._unsaved = 0
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+    def _evict(self):
+        """Drop entries older than max_age, then the least recently used beyond max_entries"""
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            for key in [k for k, entry in self._entries.items() if entry["last_seen"] < cutoff]:
+                del self._entries[key]
+
+        if self.max_entries and len(self._entries) > self.max_entries:
+            oldest = sorted(self._entries, key=lambda k: self._entries[k]["last_seen"])
+            for key in oldest[:len(self._entries) - self.max_entries]:
+                del self._entries[key]
+
+    def claim(self, prompt):
+        """
+        Reserve a prompt for submission
+
+        Returns False if it was already generated or another worker is
+        submitting it right now; the caller should then skip it.
+        """
+        key = cache_key(prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["hits"] += 1
+                entry["last_seen"] = time.time()
+                return False
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            return True
+
+    def add(self, prompt, row, outcome):
+        """Record a prompt as generated and release its claim"""
+        key = cache_key(prompt)
+        now = time.time()
+        with self._lock:
+            self._pending.discard(key)
+            self._entries[key] = {"row": row, "outcome": outcome, "first_seen": now, "last_seen": now, "hits": 0}
+            self._evict()
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def release(self, prompt):
+        """Give a claim back after a failed submit so the prompt can be tried again"""
+        with self._lock:
+            self._pending.discard(cache_key(prompt))
@@ -0,0 +1,247 @@
+"""
+Prompt source layer for the Sheet-to-Whisk automation
+
+Loads every prompt of a column in one bulk read before submission starts,
+instead of clicking through the spreadsheet one cell per round trip. The
+column, the sheet tab and the range of rows can be chosen per load.
+
+Supported sources:
+- "export": download the sheet through its CSV/XLSX export URL
+- "file":   read a local .csv, .txt or .xlsx file
+- "dom":    scrape the rendered grid of an open Sheets tab in one call
+"""
+
+import csv
+import io
+import os
+import re
+import urllib.parse
+import urllib.request
+
+
+# Fetches a URL from inside the page so the logged-in browser session is used
+FETCH_SCRIPT = """
+var url = arguments[0];
+var done = arguments[arguments.length - 1];
+fetch(url, {credentials: 'include'})
+    .then(function (response) {
+        if (!response.ok) { throw new Error('HTTP ' + response.status); }
+        return response.text();
+    })
+    .then(function (text) { done({ok: true, text: text}); })
+    .catch(function (error) { done({ok: false, error: String(error)}); });
+"""
+
+# Reads every rendered cell of one column in a single round trip
+GRID_SCRAPE_SCRIPT = """
+var column = String(arguments[0]);
+var cells = document.querySelectorAll("div[role='gridcell'][data-col='" + column + "']");
+var rows = [];
+for (var i = 0; i < cells.length; i++) {
+    var row = parseInt(cells[i].getAttribute('data-row'), 10);
+    if (!isNaN(row)) {
+        rows.push([row, cells[i].innerText || cells[i].textContent || '']);
+    }
+}
+return rows;
+"""
+
+
+def column_index(column):
+    """0-based index of a column given as an index or a letter ("A", "B", ..., "AA")"""
+    if isinstance(column, int):
+        return column
+    letters = str(column).strip().upper()
+    if not re.fullmatch(r"[A-Z]+", letters):
+        raise ValueError(f"Not a column letter: {column}")
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def parse_sheet_url(sheet_url):
+    """Return (spreadsheet_id, gid) from a Google Sheets URL"""
+    match = re.search(r"/spreadsheets/d/([a-zA-Z0-9_-]+)", sheet_url)
+    if not match:
+        raise ValueError(f"Not a Google Sheets URL: {sheet_url}")
+
+    gid = re.search(r"[?#&]gid=(\d+)(?:[&#]|$)", sheet_url)
+    return match.group(1), gid.group(1) if gid else None
+
+
+def build_export_url(sheet_url, export_format="csv"):
+    """Turn a Google Sheets edit URL into its export URL"""
+    sheet_id, gid = parse_sheet_url(sheet_url)
+    export_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format={export_format}"
+
+    # Keep the tab selection if the URL points at a specific sheet tab
+    if gid:
+        export_url += f"&gid={gid}"
+    return export_url
+
+
+def build_page_export_url(sheet_url, sheet_name=None):
+    """
+    CSV export URL that can be fetched from inside the Sheets tab
+
+    The regular export URL redirects to another domain, which an in-page
+    fetch cannot follow, so the same-origin visualization endpoint is used.
+    It also accepts a sheet tab by name, which the export URL does not.
+    """
+    sheet_id, gid = parse_sheet_url(sheet_url)
+    export_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&headers=0"
+    if sheet_name:
+        export_url += f"&sheet={urllib.parse.quote(sheet_name)}"
+    elif gid:
+        export_url += f"&gid={gid}"
+    return export_url
+
+
+def collect_prompts(values, max_empty_cells=3, first_row=1):
+    """
+    Turn raw column values into (row, prompt) pairs
+
+    Empty cells are skipped, and reading stops after max_empty_cells
+    consecutive empty cells, just like the cell-by-cell loop did.
+    """
+    prompts = []
+    empty_cells_count = 0
+
+    for offset, value in enumerate(values):
+        text = "" if value is None else str(value).strip()
+        if not text:
+            empty_cells_count += 1
+            if empty_cells_count >= max_empty_cells:
+                break
+            continue
+
+        empty_cells_count = 0
+        prompts.append((first_row + offset, text))
+
+    return prompts
+
+
+def column_from_csv(text, column=0):
+    """Extract one column from CSV text"""
+    values = []
+    for row in csv.reader(io.StringIO(text)):
+        values.append(row[column] if column < len(row) else "")
+    return values
+
+
+def column_from_xlsx(data, column=0, sheet_name=None):
+    """Extract one column from a worksheet of an XLSX workbook, the first one by default"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Reading .xlsx files needs openpyxl: pip install openpyxl")
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        values = []
+        for row in sheet.iter_rows(min_col=column + 1, max_col=column + 1, values_only=True):
+            values.append(row[0] if row else None)
+        return values
+    finally:
+        workbook.close()
+
+
+def google_cookies(driver):
+    """
+    Cookie header with the browser's Google session, for fetching a sheet outside the browser
+
+    Read through DevTools, which returns the cookies of any site without
+    the driver's tab having to show it.
+    """
+    result = driver.execute_cdp_cmd("Network.getCookies", {"urls": ["https://docs.google.com/"]})
+    return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in result.get("cookies", []))
+
+
+def read_export(sheet_url, driver=None, column=0, export_format="csv", sheet_name=None, cookies=None):
+    """
+    Download the sheet through its export URL
+
+    With a driver, the download runs inside the page so private sheets
+    work with the logged-in profile. Without one, the URL is fetched
+    directly, which only works for sheets shared by link unless the
+    profile's cookies are passed along (see google_cookies).
+    """
+    if driver is not None and export_format == "csv":
+        result = driver.execute_async_script(FETCH_SCRIPT, build_page_export_url(sheet_url, sheet_name))
+        if not result or not result.get("ok"):
+            raise RuntimeError(f"Could not download sheet export: {result and result.get('error')}")
+        return column_from_csv(result["text"], column)
+
+    if (sheet_name or cookies) and export_format == "csv":
+        # Stays on docs.google.com, where the cookies belong
+        export_url = build_page_export_url(sheet_url, sheet_name)
+    else:
+        export_url = build_export_url(sheet_url, export_format)
+    request = urllib.request.Request(export_url, headers={"Cookie": cookies} if cookies else {})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        data = response.read()
+
+    if export_format == "xlsx":
+        return column_from_xlsx(data, column, sheet_name)
+    return column_from_csv(data.decode("utf-8-sig"), column)
+
+
+def read_file(path, column=0, sheet_name=None):
+    """Read one column from a local .csv, .txt or .xlsx file"""
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".xlsx":
+        with open(path, "rb") as f:
+            return column_from_xlsx(f.read(), column, sheet_name)
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        text = f.read()
+
+    if extension == ".csv":
+        return column_from_csv(text, column)
+
+    # Plain text: one prompt per line
+    return text.splitlines()
+
+
+def read_grid(driver, column=0):
+    """Scrape every rendered cell of a column from the open Sheets tab"""
+    rows = driver.execute_script(GRID_SCRAPE_SCRIPT, column) or []
+    if not rows:
+        return []
+
+    # Build a dense list so gaps in the grid still count as empty cells
+    values = [""] * (max(row for row, _ in rows) + 1)
+    for row, text in rows:
+        values[row] = text
+    return values
+
+
+def load_prompts(source, sheet_url=None, prompt_file=None, driver=None,
+                 column=0, max_empty_cells=3, export_format="csv",
+                 sheet_name=None, first_row=1, last_row=None, cookies=None):
+    """
+    Load every prompt of a column in one bulk read
+
+    column is an index or a letter, sheet_name picks a sheet tab (the
+    "dom" source reads whichever tab is open), and only rows first_row to
+    last_row are used. Returns a list of (row, prompt) pairs, where row
+    is the 1-based spreadsheet row the prompt came from.
+    """
+    column = column_index(column)
+    if source == "export":
+        values = read_export(sheet_url, driver=driver, column=column, export_format=export_format,
+                             sheet_name=sheet_name, cookies=cookies)
+    elif source == "file":
+        values = read_file(prompt_file, column=column, sheet_name=sheet_name)
+    elif source == "dom":
+        if driver is None:
+            raise ValueError("The 'dom' prompt source needs an open Sheets tab")
+        values = read_grid(driver, column=column)
+    else:
+        raise ValueError(f"Unknown prompt source: {source}")
+
+    values = values[first_row - 1:last_row]
+    return collect_prompts(values, max_empty_cells=max_empty_cells, first_row=first_row)
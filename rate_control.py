@@ -0,0 +1,82 @@
+"""
+Adaptive submission rate control
+
+Treats Whisk's "Please wait" overload popup as a congestion signal and
+adjusts the submission rate AIMD-style: the rate grows by a fixed step
+for every prompt accepted without the popup, and is cut by a factor every
+time the popup appears. Over a run this settles near the rate Whisk can
+actually sustain.
+"""
+
+import threading
+import time
+
+
+class AdaptiveRateController:
+    """AIMD rate limiter shared by every worker submitting to one account"""
+
+    def __init__(self, initial_rate=20, min_rate=4, max_rate=60,
+                 increase_step=1, decrease_factor=0.5):
+        # Rates are in prompts per minute
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self._rate = min(max(initial_rate, min_rate), max_rate)
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+        self.successes = 0
+        self.overloads = 0
+
+    @property
+    def rate(self):
+        """Current submission rate in prompts per minute"""
+        return self._rate
+
+    def interval(self):
+        """Seconds between submissions at the current rate"""
+        return 60.0 / self._rate
+
+    def acquire(self, stop_event=None):
+        """
+        Block until the next submission slot
+
+        Slots are handed out in order, so several workers calling this at
+        once are spread out at the current rate instead of bursting.
+        Returns the number of seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval()
+            delay = slot - now
+
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+        return delay
+
+    def on_success(self):
+        """Additive increase: Whisk accepted a prompt without the popup"""
+        with self._lock:
+            self.successes += 1
+            self._rate = min(self._rate + self.increase_step, self.max_rate)
+
+    def on_overload(self):
+        """Multiplicative decrease: Whisk showed the overload popup"""
+        with self._lock:
+            self.overloads += 1
+            self._rate = max(self._rate * self.decrease_factor, self.min_rate)
+            # Push the next slot out so the slowdown takes effect right away
+            self._next_slot = max(self._next_slot, time.monotonic() + self.interval())
+
+    def metrics(self):
+        """Current controller state for progress output and metrics export"""
+        with self._lock:
+            return {
+                "rate_per_minute": round(self._rate, 2),
+                "successes": self.successes,
+                "overloads": self.overloads,
+            }
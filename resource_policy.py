@@ -0,0 +1,112 @@
+"""
+Resource budgets for long runs
+
+Keeps every tab lean over hours of submitting. Requests for assets the
+automation never needs (web fonts, analytics) are blocked through the
+DevTools Network.setBlockedURLs command, and memory is checked every few
+prompts: a Whisk tab whose JavaScript heap has grown past its limit is
+reloaded, which drops the generated results piled up in its DOM, and a
+Chrome that uses too much memory altogether is recycled by the supervisor.
+"""
+
+from diagnostics import log
+
+
+# Actions ResourcePolicy.check asks for
+RELOAD_TAB = "reload_tab"
+RECYCLE_BROWSER = "recycle_browser"
+
+# performance.memory needs --enable-precise-memory-info to be up to date
+MEMORY_SCRIPT = "return window.performance && performance.memory ? performance.memory.usedJSHeapSize : null;"
+
+
+def block_urls(driver, patterns):
+    """Block requests matching the wildcard patterns in the driver's current tab"""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(patterns)})
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and all its children in MB, or None without psutil"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    try:
+        process = psutil.Process(pid)
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+    except psutil.Error:
+        return None
+    return total / (1024 * 1024)
+
+
+class ResourcePolicy:
+    """Decides when a session's tab or the whole browser has to be refreshed"""
+
+    def __init__(self, blocked_urls=(), check_every=25, tab_limit_mb=0, browser_limit_mb=0, reload_timeout=5):
+        self.blocked_urls = list(blocked_urls)
+        self.check_every = check_every
+        self.tab_limit_mb = tab_limit_mb
+        self.browser_limit_mb = browser_limit_mb
+        self.reload_timeout = reload_timeout
+        # Process whose tree is measured against browser_limit_mb, see watch()
+        self.browser_pid = None
+        self.prompts = {}
+        self.warned = False
+
+    def watch(self, driver, attached=False):
+        """
+        Measure the Chrome started by this driver
+
+        Chrome runs as a child of chromedriver, so the chromedriver process
+        tree is measured. An attached warm browser is not a child, and its
+        memory is not checked.
+        """
+        if attached:
+            self.browser_pid = None
+            if self.browser_limit_mb and not self.warned:
+                log("BROWSER_MEMORY_LIMIT_MB is not checked for an attached warm browser")
+                self.warned = True
+            return
+        process = getattr(driver.service, "process", None)
+        self.browser_pid = process.pid if process else None
+
+    def apply(self, session):
+        """Set up a newly opened session"""
+        if self.blocked_urls:
+            session.block_urls(self.blocked_urls)
+
+    def check(self, session):
+        """
+        Count a finished prompt for the session and check memory when due
+
+        Returns RELOAD_TAB, RECYCLE_BROWSER or None.
+        """
+        if not self.check_every:
+            return None
+        count = self.prompts.get(id(session), 0) + 1
+        self.prompts[id(session)] = count
+        if count % self.check_every:
+            return None
+
+        if self.browser_limit_mb and self.browser_pid:
+            used = process_tree_rss_mb(self.browser_pid)
+            if used is None and not self.warned:
+                log("Browser memory can't be measured, install psutil to use BROWSER_MEMORY_LIMIT_MB")
+                self.warned = True
+            elif used and used > self.browser_limit_mb:
+                session.log(f"Chrome uses {used:.0f} MB (limit {self.browser_limit_mb} MB)")
+                return RECYCLE_BROWSER
+
+        if self.tab_limit_mb:
+            used = session.memory_usage()
+            if used and used > self.tab_limit_mb:
+                session.log(f"Whisk tab uses {used:.0f} MB of JavaScript heap (limit {self.tab_limit_mb} MB)")
+                return RELOAD_TAB
+        return None
@@ -0,0 +1,141 @@
+"""
+Crash recovery for long unattended runs
+
+The BrowserSupervisor owns the main browser and the Whisk sessions. When
+a worker finds the browser dead or hung, the WorkerPool stops, and the
+supervisor closes what is left, relaunches Chrome with the same profile
+after a bounded exponential backoff, reopens the Whisk tabs and carries
+on with the prompts the progress journal has not confirmed yet. A browser
+that uses too much memory is recycled the same way, without the wait.
+The Whisk tabs stay open from one run() to the next, so queued jobs share
+them.
+"""
+
+import time
+
+import config
+from browser import BrowserContext, start_browser
+from diagnostics import log
+
+
+class BrowserSupervisor:
+    """Starts, watches and restarts the browser a run depends on"""
+
+    def __init__(self, open_sessions, max_restarts=3, backoff_base=5, backoff_max=120):
+        # Callable (main_browser, attached) -> (sessions, extra_browsers, engine)
+        self.open_sessions = open_sessions
+        self.max_restarts = max_restarts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.restarts = 0
+        self.recycles = 0
+        self.driver = None
+        self.attached = False
+        self.main_browser = None
+        self.sessions = []
+        self.extra_browsers = []
+        self.engine = None
+        self.pool = None
+        self.finished_results = []
+        # Set once max_restarts is used up, later jobs are not started
+        self.gave_up = False
+
+    def start(self):
+        """Launch the main browser, or attach to the warm one; returns its driver"""
+        self.driver, self.attached = start_browser(config.CHROME_PROFILE_PATH)
+        self.main_browser = BrowserContext(self.driver)
+        return self.driver
+
+    def _open_whisk(self):
+        self.sessions, self.extra_browsers, self.engine = self.open_sessions(self.main_browser, self.attached)
+        log(f"Opened {len(self.sessions)} Whisk session(s). Starting automation...")
+
+        # Wait for the Whisk tabs to load properly
+        for session in self.sessions:
+            session.wait_until_ready(config.PAGE_LOAD_WAIT)
+        return self.sessions
+
+    def _close_whisk(self):
+        """Close the sessions and every browser except the main one"""
+        if self.engine:
+            self.engine.close()
+            self.engine = None
+        for browser in self.extra_browsers:
+            try:
+                browser.driver.quit()
+            except Exception:
+                pass
+        self.extra_browsers = []
+        self.sessions = []
+
+    def restart_delay(self):
+        """Seconds to wait before the next restart, doubling with every restart"""
+        return min(self.backoff_base * (2 ** self.restarts), self.backoff_max)
+
+    def restart(self, recycle=False):
+        """
+        Throw the browser away and start a new one with the same profile
+
+        A broken browser is restarted after the backoff delay and counts
+        towards max_restarts; a healthy one is recycled straight away.
+        """
+        if recycle:
+            delay = 0
+            self.recycles += 1
+            log("\n♻️  Recycling the browser to free memory...")
+        else:
+            delay = self.restart_delay()
+            self.restarts += 1
+            log(f"\n🔄 Restarting the browser in {delay} seconds (restart {self.restarts} of {self.max_restarts})...")
+
+        self._close_whisk()
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        time.sleep(delay)
+        self.start()
+
+    def run(self, make_pool, prompts, journal):
+        """
+        Submit prompts with pools built by make_pool(sessions), restarting as needed
+
+        Returns the (row, outcome) results of this call's pools. After a
+        restart, only the prompts the journal has not recorded as done are
+        submitted. Sessions left open by an earlier call are reused.
+        """
+        results = []
+        while True:
+            pool = self.pool = make_pool(self.sessions or self._open_whisk())
+            pool.run(prompts)
+            results += pool.results
+            self.finished_results += pool.results
+            self.pool = None
+            if not (pool.browser_lost or pool.recycle_requested):
+                return sorted(results)
+
+            if pool.browser_lost and self.restarts >= self.max_restarts:
+                log(f"Browser failed {self.restarts + 1} times, giving up. Run with --resume to continue later")
+                self.gave_up = True
+                return sorted(results)
+
+            prompts = journal.remaining(prompts)
+            self.restart(recycle=not pool.browser_lost)
+
+    def results(self):
+        """Results so far, including the pool that is still running"""
+        results = list(self.finished_results)
+        if self.pool:
+            results += self.pool.results
+        return sorted(results)
+
+    def close(self):
+        """Close the sessions and quit or detach from the main browser"""
+        self._close_whisk()
+        if self.driver is None:
+            return
+        if self.attached:
+            # Leave the warm browser and its tabs running for the next run
+            self.driver.service.stop()
+        else:
+            self.driver.quit()
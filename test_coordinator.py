@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the coordinator's leases: expiry, release, attempts and changed prompts
+"""
+
+import os
+import tempfile
+
+from coordinator import DONE, PENDING, LeaseStore
+from job_queue import Job
+
+
+def make_store(max_attempts=3):
+    directory = tempfile.mkdtemp()
+    return LeaseStore(os.path.join(directory, "coordinator.sqlite"), max_attempts)
+
+
+def test_expired_lease_goes_to_another_worker():
+    store = make_store()
+    store.add("job", [(1, "fish")])
+    rows, _ = store.claim("a", "job", 10, lease_seconds=-1)
+    assert rows == [[1, "fish"]]
+    rows, _ = store.claim("b", "job", 10, lease_seconds=60)
+    assert rows == [[1, "fish"]]
+    # A live lease is not handed out again
+    assert store.claim("c", "job", 10, lease_seconds=60) == ([], 1)
+
+
+def test_release_hands_row_back_until_attempts_run_out():
+    store = make_store(max_attempts=2)
+    store.add("job", [(1, "fish")])
+    for worker in ("a", "b"):
+        rows, _ = store.claim(worker, "job", 10, lease_seconds=60)
+        assert rows == [[1, "fish"]]
+        store.release(worker, "job", 1, "failed")
+    assert store.claim("c", "job", 10, lease_seconds=60) == ([], 0)
+    assert store.status() == {"job": {PENDING: 1}}
+
+
+def test_release_only_by_lease_holder():
+    store = make_store()
+    store.add("job", [(1, "fish")])
+    store.claim("a", "job", 10, lease_seconds=60)
+    store.release("b", "job", 1, "failed")
+    assert store.claim("b", "job", 10, lease_seconds=60) == ([], 1)
+
+
+def test_finished_rows_are_not_added_again():
+    store = make_store()
+    store.add("job", [(1, "fish"), (2, "bird")])
+    for row, _ in store.claim("a", "job", 10, lease_seconds=60)[0]:
+        store.complete("a", "job", row, "submitted")
+    assert store.add("job", [(1, "fish"), (2, "bird"), (3, "frog")]) == 1
+    assert store.claim("a", "job", 10, lease_seconds=60)[0] == [[3, "frog"]]
+
+
+def test_changed_prompt_is_submitted_again():
+    store = make_store()
+    store.add("job", [(1, "fish"), (2, "bird")])
+    for row, _ in store.claim("a", "job", 10, lease_seconds=60)[0]:
+        store.complete("a", "job", row, "submitted")
+    assert store.add("job", [(1, "cat"), (2, "bird"), (3, "frog")]) == 2
+    assert store.claim("a", "job", 10, lease_seconds=60)[0] == [[1, "cat"], [3, "frog"]]
+
+
+def test_changed_prompt_replaces_pending_text():
+    store = make_store()
+    store.add("job", [(1, "fish")])
+    store.add("job", [(1, "cat")])
+    assert store.claim("a", "job", 10, lease_seconds=60)[0] == [[1, "cat"]]
+
+
+def test_changed_prompt_leaves_live_lease_alone():
+    store = make_store()
+    store.add("job", [(1, "fish")])
+    store.claim("a", "job", 10, lease_seconds=60)
+    assert store.add("job", [(1, "cat")]) == 0
+    store.complete("a", "job", 1, "submitted")
+    assert store.status() == {"job": {DONE: 1}}
+
+
+def test_jobs_from_different_sheets_do_not_collide():
+    first = Job(sheet_url="https://docs.google.com/spreadsheets/d/ONE/edit")
+    second = Job(sheet_url="https://docs.google.com/spreadsheets/d/TWO/edit")
+    other_tab = Job(sheet_url="https://docs.google.com/spreadsheets/d/ONE/edit", sheet_name="Tab 2")
+    assert first.label == second.label
+    assert len({first.key, second.key, other_tab.key}) == 3
+
+    store = make_store()
+    store.add(first.key, [(1, "fish")])
+    store.add(second.key, [(1, "bird")])
+    assert store.claim("a", first.key, 10, lease_seconds=60)[0] == [[1, "fish"]]
+    assert store.claim("a", second.key, 10, lease_seconds=60)[0] == [[1, "bird"]]
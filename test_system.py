@@ -37,11 +37,11 @@ def check_dependencies():
 def check_chrome():
     """Check if Chrome is available"""
     try:
-        # Try to import webdriver manager
-        from webdriver_manager.chrome import ChromeDriverManager
+        # Resolve ChromeDriver the same way the automation does (cached after the first run)
+        from browser import resolve_driver_path
         
         # Try to get ChromeDriver path (downloads if needed)
-        driver_path = ChromeDriverManager().install()
+        driver_path = resolve_driver_path()
         print("✅ Chrome and ChromeDriver are available")
         print(f"   Driver path: {driver_path}")
         return True
@@ -55,7 +55,7 @@ def test_basic_selenium():
         from selenium import webdriver
         from selenium.webdriver.chrome.service import Service
         from selenium.webdriver.chrome.options import Options
-        from webdriver_manager.chrome import ChromeDriverManager
+        from browser import resolve_driver_path
         
         print("🧪 Testing basic Selenium functionality...")
         
@@ -108,7 +108,7 @@ def test_basic_selenium():
         
         # Create driver
         driver = webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()), 
+            service=Service(resolve_driver_path()), 
             options=chrome_options
         )
         
@@ -0,0 +1,113 @@
+"""
+Event-driven waits for the Whisk submit cycle
+
+Each step of the cycle waits only until its readiness condition is met
+(input cleared, text accepted, submit accepted, generation tile shown)
+instead of sleeping a fixed time. The configured wait values are kept as
+upper bounds, and plain sleeps are used again if event waits are disabled.
+"""
+
+import time
+
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+# Installs a MutationObserver once per page load and returns a snapshot of
+# the page state in the same round trip
+SNAPSHOT_SCRIPT = """
+var tileSelector = arguments[0];
+if (!window.__autometionObserver) {
+    window.__autometionMutations = 0;
+    window.__autometionObserver = new MutationObserver(function (records) {
+        window.__autometionMutations += records.length;
+    });
+    window.__autometionObserver.observe(document.documentElement, {
+        childList: true, subtree: true, attributes: true, characterData: true
+    });
+}
+return {
+    mutations: window.__autometionMutations,
+    tiles: document.querySelectorAll(tileSelector).length
+};
+"""
+
+
+class WaitEngine:
+    """Waits on page conditions, with the configured sleeps as upper bounds"""
+
+    def __init__(self, driver, enabled=True, poll_interval=0.05,
+                 tile_selector="img[src^='blob:'], img[src^='data:image']", guard=None):
+        self.driver = driver
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self.tile_selector = tile_selector
+        # Optional context manager factory held around every check, so
+        # sessions sharing one driver only hold it while polling
+        self.guard = guard
+
+    def until(self, condition, upper_bound):
+        """
+        Wait until condition(driver) is truthy, for at most upper_bound seconds
+
+        Returns True if the condition was met and False on timeout. With
+        event waits disabled, this sleeps the full upper bound like before.
+        """
+        if not self.enabled:
+            time.sleep(upper_bound)
+            return True
+
+        if self.guard is not None:
+            unguarded = condition
+
+            def condition(driver):
+                with self.guard():
+                    return unguarded(driver)
+
+        try:
+            WebDriverWait(
+                self.driver,
+                upper_bound,
+                poll_frequency=self.poll_interval,
+                ignored_exceptions=[StaleElementReferenceException]
+            ).until(condition)
+            return True
+        except TimeoutException:
+            return False
+
+    def snapshot(self):
+        """Return the page mutation counter and generation tile count"""
+        try:
+            return self.driver.execute_script(SNAPSHOT_SCRIPT, self.tile_selector)
+        except Exception:
+            return {"mutations": 0, "tiles": 0}
+
+    def wait_for_value(self, element, expected, upper_bound):
+        """Wait until the input holds the expected text"""
+        return self.until(lambda d: (element.get_attribute('value') or "") == expected, upper_bound)
+
+    def wait_for_cleared(self, element, upper_bound):
+        """Wait until the input is empty"""
+        return self.wait_for_value(element, "", upper_bound)
+
+    def wait_for_submit_accepted(self, element, before, upper_bound):
+        """
+        Wait until Whisk reacts to the submit
+
+        The submit counts as accepted once the app clears the input or the
+        page changes since the snapshot taken before pressing Enter.
+        """
+        def accepted(driver):
+            try:
+                if not (element.get_attribute('value') or "").strip():
+                    return True
+            except StaleElementReferenceException:
+                # The input was re-rendered, which also means the app reacted
+                return True
+            return self.snapshot()["mutations"] > before["mutations"]
+
+        return self.until(accepted, upper_bound)
+
+    def wait_for_generation(self, before, upper_bound):
+        """Wait until a new generation tile appears on the page"""
+        return self.until(lambda d: self.snapshot()["tiles"] > before["tiles"], upper_bound)
@@ -0,0 +1,312 @@
+"""
+One Whisk tab that prompts are submitted to
+
+Holds the submit cycle that used to live inline in the main loop: find
+the input, enter the prompt, submit it, handle the overload popup and
+clear the input again.
+"""
+
+import threading
+from contextlib import ExitStack
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.keys import Keys
+
+import config
+from completion_detector import CompletionTracker, is_overload
+from diagnostics import log
+from image_harvester import READ_SCRIPT, TAG_SCRIPT, UNTAGGED_SCRIPT
+from input_injection import inject_value
+from locators import LocatorRegistry
+from metrics import PromptTimer
+from popup_detection import OverloadDetector
+from resource_policy import MEMORY_SCRIPT, block_urls
+from waits import WaitEngine
+
+
+# Outcomes returned by WhiskSession.submit
+SUBMITTED = "submitted"
+OVERLOADED = "overloaded"
+NO_INPUT = "no_input"
+FAILED = "failed"
+DUPLICATE = "duplicate"
+
+
+class WhiskSession:
+    """A Whisk tab inside a BrowserContext"""
+
+    def __init__(self, browser, handle, name=None):
+        self.browser = browser
+        self.driver = browser.driver
+        self.handle = handle
+        self.name = name
+        self.waits = WaitEngine(
+            self.driver,
+            enabled=config.USE_EVENT_WAITS,
+            poll_interval=config.WAIT_POLL_INTERVAL,
+            tile_selector=config.GENERATION_TILE_SELECTOR,
+            guard=self.focused
+        )
+        self.overload = OverloadDetector(self.driver, config.POPUP_TEXTS)
+        self.locators = LocatorRegistry(self.driver)
+        self.locators.register("prompt_input", config.PROMPT_INPUT_SELECTORS)
+        # Headless runs never type, every prompt is injected
+        self.input_mode = "inject" if config.HEADLESS else config.INPUT_MODE
+        # Prompt typed ahead into the input during the previous cycle, if any
+        self.staged_prompt = None
+        # Whether the current submit cycle got as far as pressing Enter
+        self.enter_sent = False
+        # Generation requests of this tab, when completion detection is on
+        self.network = None
+        if browser.network_log:
+            self.network = CompletionTracker(config.GENERATION_URL_PATTERN)
+            browser.network_log.register(handle, self.network)
+
+    def focused(self):
+        """Hold the shared driver with this session's tab selected"""
+        return self.browser.focus(self.handle)
+
+    def log(self, message):
+        """Log a message, tagged with the session name when running in a pool"""
+        log(f"[{self.name}] {message}" if self.name else message)
+
+    def is_alive(self, timeout=10):
+        """True if this tab still answers a trivial script within timeout seconds"""
+        answered = threading.Event()
+
+        def ping():
+            try:
+                with self.focused():
+                    self.driver.execute_script("return 1")
+                answered.set()
+            except Exception:
+                pass
+
+        # In a thread of its own, so a hung driver can't hang the check too
+        threading.Thread(target=ping, daemon=True).start()
+        return answered.wait(timeout)
+
+    def block_urls(self, patterns):
+        """Block requests matching the wildcard patterns in this tab"""
+        with self.focused():
+            block_urls(self.driver, patterns)
+
+    def screenshot_png(self):
+        """Screenshot of this tab as PNG bytes"""
+        with self.focused():
+            return self.driver.get_screenshot_as_png()
+
+    def memory_usage(self):
+        """JavaScript heap this tab uses in MB, or None if Chrome doesn't report it"""
+        with self.focused():
+            used = self.driver.execute_script(MEMORY_SCRIPT)
+        return used / (1024 * 1024) if used else None
+
+    def reload(self, timeout):
+        """Reload the tab, dropping the results Whisk piled up in it"""
+        with self.focused():
+            self.driver.refresh()
+        self.locators.invalidate()
+        self.overload.element = None
+        self.staged_prompt = None
+        return self.wait_until_ready(timeout)
+
+    def wait_until_ready(self, timeout):
+        """Wait until the Whisk prompt input is on the page, for at most timeout seconds"""
+        def input_present(driver):
+            try:
+                self.locators.resolve("prompt_input")
+                return True
+            except NoSuchElementException:
+                return False
+
+        return self.waits.until(input_present, timeout)
+
+    def tag_new_images(self, wait=0, count=1):
+        """
+        Tag the generation tiles that appeared since the last call and return the tags
+
+        Waits up to wait seconds for count new tiles to show up, so every
+        image of the prompt is tagged together.
+        """
+        if wait:
+            self.waits.until(
+                lambda d: d.execute_script(UNTAGGED_SCRIPT, config.GENERATION_TILE_SELECTOR) >= count, wait
+            )
+        with self.focused():
+            return self.driver.execute_script(TAG_SCRIPT, config.GENERATION_TILE_SELECTOR)
+
+    def read_image(self, tag):
+        """Read a tagged image from the page as a data: URL"""
+        with self.focused():
+            return self.driver.execute_async_script(READ_SCRIPT, tag)
+
+    def _enter_prompt(self, prompt, timer):
+        """
+        Locate, clear and fill the prompt input; the driver must be held
+
+        Returns the input element, or None if it could not be found.
+        With INPUT_MODE = "inject" the value is set in one script call, and
+        keystroke typing is only used if Whisk did not accept it.
+        """
+        if self.input_mode == "inject":
+            # Locate, replace any existing text and confirm in one round trip
+            accepted = []
+            with timer.stage("type"):
+                try:
+                    text_input = self.locators.act(
+                        "prompt_input",
+                        lambda element: accepted.append(inject_value(self.driver, element, prompt))
+                    )
+                except NoSuchElementException:
+                    return None
+            if accepted[-1]:
+                return text_input
+            self.log("Direct input was not accepted, typing the prompt instead")
+
+        # Click on the input field, looking it up again only if it went stale
+        with timer.stage("input_locate"):
+            try:
+                text_input = self.locators.act("prompt_input", lambda element: element.click())
+            except NoSuchElementException:
+                return None
+
+        # Clear any existing text
+        with timer.stage("clear"):
+            text_input.send_keys(Keys.CONTROL + 'a')
+            text_input.send_keys(Keys.DELETE)
+            self.waits.wait_for_cleared(text_input, config.SHORT_WAIT)
+
+        # Input the text directly using Selenium (no clipboard needed)
+        with timer.stage("type"):
+            text_input.send_keys(prompt)
+            self.waits.wait_for_value(text_input, prompt, config.SHORT_WAIT)
+        return text_input
+
+    def _take_staged(self, prompt, timer):
+        """Return the input if it still holds the prompt staged during the last cycle"""
+        staged, self.staged_prompt = self.staged_prompt, None
+        if staged != prompt:
+            return None
+        with timer.stage("input_locate"):
+            try:
+                text_input = self.locators.get("prompt_input")
+                if text_input.get_attribute('value') == prompt:
+                    return text_input
+            except Exception:
+                pass
+        return None
+
+    def _wait_for_generation(self, before_submit, network_mark, timer):
+        """
+        Wait until Whisk has generated, as told by its network traffic if possible
+
+        Returns the generation request's completion, or None without
+        completion detection or when no request was seen.
+        """
+        if not self.network or not self.browser.network_log.available:
+            # Until the generation tile appears
+            self.waits.wait_for_generation(before_submit, config.WAIT_AFTER_SUBMIT)
+            return None
+
+        completion = self.browser.network_log.wait(
+            self.network, network_mark, config.WAIT_AFTER_SUBMIT, config.GENERATION_TIMEOUT, config.WAIT_POLL_INTERVAL
+        )
+        if completion:
+            timer.details["generation"] = {
+                key: completion[key] for key in ("status", "latency", "failed", "error")
+            }
+            self.log(f"Generation request returned {completion['status'] or completion['error']} "
+                     f"after {completion['latency']}s")
+        return completion
+
+    def submit(self, row, prompt, timer=None, next_prompt=None):
+        """
+        Run one submit cycle for a prompt
+
+        Returns SUBMITTED, OVERLOADED when Whisk showed its overload popup
+        or its generation request returned an overload status, or NO_INPUT
+        when the prompt input could not be found. If it raises, enter_sent
+        tells whether the prompt may already have reached Whisk.
+        The driver is only held while talking to the page, so other sessions
+        sharing the browser can submit while this one waits for Whisk.
+        Stage timings are added to timer, a metrics.PromptTimer, if given.
+
+        With next_prompt, the cycle is pipelined: once Whisk has accepted
+        this prompt, the next one is typed into the input while Whisk is
+        still generating, and the next submit only has to press Enter.
+        """
+        timer = timer or PromptTimer(row)
+        self.enter_sent = False
+
+        with ExitStack() as page:
+            with timer.stage("tab_switch"):
+                page.enter_context(self.focused())
+
+            text_input = self._take_staged(prompt, timer) or self._enter_prompt(prompt, timer)
+            if not text_input:
+                self.log("Could not find text input field!")
+                return NO_INPUT
+
+            self.log(f"Pasted content from row {row}: {prompt[:50]}...")
+
+            # Submit by pressing Enter key, then wait until Whisk reacts
+            with timer.stage("submit"):
+                before_submit = self.waits.snapshot()
+                network_mark = None
+                if self.network:
+                    # Leave earlier traffic behind, so only this submit's request counts
+                    self.browser.network_log.drain()
+                    network_mark = self.network.mark()
+                # Set first: a send_keys that raises may still have submitted
+                self.enter_sent = True
+                text_input.send_keys(Keys.ENTER)
+                self.waits.wait_for_submit_accepted(text_input, before_submit, config.WAIT_FOR_ACCEPT)
+            self.log("Submitted prompt by pressing Enter")
+
+            with timer.stage("popup_check"):
+                try:
+                    overload_popup = self.overload.detect()
+                except Exception as e:
+                    self.log(f"Could not check for overload popup: {e}")
+                    overload_popup = None
+
+            # Prepare the next prompt while Whisk works on this one
+            if next_prompt:
+                with timer.stage("prestage"):
+                    try:
+                        if self._enter_prompt(next_prompt, PromptTimer(row)):
+                            self.staged_prompt = next_prompt
+                    except Exception as e:
+                        self.log(f"Could not stage the next prompt: {e}")
+
+        completion = None
+        with timer.stage("wait"):
+            if overload_popup:
+                self.log(f"⚠️  Detected overload popup: '{overload_popup['text'][:60]}'")
+                self.log(f"    Waiting up to {config.WAIT_FOR_POPUP} seconds to let Whisk catch up...")
+                self.waits.until(lambda d: not self.overload.is_showing(), config.WAIT_FOR_POPUP)
+            # An overloaded prompt may still be generating, and its images
+            # have to land before they are tagged for this row
+            completion = self._wait_for_generation(before_submit, network_mark, timer)
+        overloaded = overload_popup or is_overload(completion)
+
+        # The input already holds the next prompt, so there is nothing to clear
+        if self.staged_prompt:
+            return OVERLOADED if overloaded else SUBMITTED
+
+        # Clear the text box
+        with timer.stage("cleanup"), self.focused():
+            try:
+                if self.input_mode == "inject":
+                    self.locators.act("prompt_input", lambda element: inject_value(self.driver, element, ""))
+                else:
+                    text_input = self.locators.act("prompt_input", lambda element: element.click())
+                    text_input.send_keys(Keys.CONTROL + 'a')
+                    text_input.send_keys(Keys.DELETE)
+                    self.waits.wait_for_cleared(text_input, config.SHORT_WAIT)
+                self.log("Cleared text box")
+            except:
+                self.log("Could not clear text box. It might have been cleared automatically")
+
+        return OVERLOADED if overloaded else SUBMITTED
@@ -0,0 +1,306 @@
+"""
+Parallel Whisk submission pool
+
+Several WhiskSession workers take prompts from one shared queue. Each
+worker is its own Whisk tab or its own Chrome process, and backs off on
+its own when Whisk reports it is overloaded.
+"""
+
+import queue
+import threading
+
+from metrics import PromptTimer
+from resource_policy import RECYCLE_BROWSER, RELOAD_TAB
+from whisk_session import DUPLICATE, FAILED, NO_INPUT, OVERLOADED, SUBMITTED
+
+
+class Worker:
+    """A WhiskSession plus its own backoff state"""
+
+    def __init__(self, session, backoff_base=2, backoff_max=60):
+        self.session = session
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.overloads_in_a_row = 0
+
+    def backoff_delay(self):
+        """Seconds to pause after the latest overload, doubling each time it repeats"""
+        if self.overloads_in_a_row == 0:
+            return 0
+        return min(self.backoff_base * (2 ** (self.overloads_in_a_row - 1)), self.backoff_max)
+
+    def record(self, outcome):
+        """Update the backoff state from a submit outcome"""
+        if outcome == OVERLOADED:
+            self.overloads_in_a_row += 1
+        else:
+            self.overloads_in_a_row = 0
+
+
+class WorkerPool:
+    """Feeds prompts from a shared queue to a set of workers"""
+
+    def __init__(self, sessions, max_in_flight=0, backoff_base=2, backoff_max=60,
+                 rate_controller=None, journal=None, cache=None, metrics=None, pipelined=False,
+                 harvester=None, max_retries=0, health_timeout=10, resource_policy=None, progress=None,
+                 lease_reporter=None, diagnostics=None):
+        self.workers = [Worker(s, backoff_base, backoff_max) for s in sessions]
+        # Optional AdaptiveRateController pacing submissions across all workers
+        self.rate_controller = rate_controller
+        # Optional ProgressJournal that every outcome is written to
+        self.journal = journal
+        # Optional PromptCache used to skip prompts already generated
+        self.cache = cache
+        # Optional MetricsRecorder timing every stage of every prompt
+        self.metrics = metrics
+        # Fetch and type the next prompt while Whisk generates the current one
+        self.pipelined = pipelined
+        # Optional ImageHarvester that saves the images of every submitted prompt
+        self.harvester = harvester
+        # Extra attempts for a prompt whose submit raised, with the backoff above
+        self.max_retries = max_retries
+        self.health_timeout = health_timeout
+        # Set when a worker found the browser dead or hung and stopped the pool
+        self.browser_lost = False
+        # Optional ResourcePolicy blocking assets and watching memory
+        self.resource_policy = resource_policy
+        # Set when the browser uses too much memory and the pool stopped for a recycle
+        self.recycle_requested = False
+        # Optional Job told about every outcome, for per-job progress
+        self.progress = progress
+        # Optional LeaseReporter passing every outcome on to the coordinator
+        self.lease_reporter = lease_reporter
+        # Optional Diagnostics saving a screenshot when a submit raises
+        self.diagnostics = diagnostics
+        # Limits how many workers may be in a submit cycle at the same time
+        limit = max_in_flight or len(self.workers)
+        self.in_flight = threading.BoundedSemaphore(limit)
+        self.stop_event = threading.Event()
+        self.results = []
+        self.results_lock = threading.Lock()
+
+    def stop(self):
+        """Ask every worker to finish its current prompt and stop"""
+        self.stop_event.set()
+
+    def _next_item(self, prompt_queue, session):
+        """Take the next (row, prompt) to submit, skipping duplicates, or None when done"""
+        while True:
+            try:
+                row, prompt = prompt_queue.get_nowait()
+            except queue.Empty:
+                return None
+
+            if self.cache and not self.cache.claim(prompt):
+                session.log(f"Skipping row {row}: same prompt was already generated")
+                self._finish(row, prompt, DUPLICATE)
+                continue
+            return row, prompt
+
+    def _work(self, worker, prompt_queue):
+        """Worker thread: submit prompts until the queue is empty"""
+        session = worker.session
+        if self.resource_policy:
+            try:
+                self.resource_policy.apply(session)
+            except Exception as e:
+                session.log(f"Could not apply the resource policy: {e}")
+        if self.harvester:
+            # Images already on the page belong to earlier runs, don't save them
+            self._harvest(session, None)
+        item = self._next_item(prompt_queue, session)
+
+        while item is not None:
+            if self.stop_event.is_set():
+                self._give_back(prompt_queue, item)
+                return
+
+            row, prompt = item
+            # In pipelined mode the next prompt is claimed now, so it can be
+            # typed into Whisk while this one is generating
+            next_item = self._next_item(prompt_queue, session) if self.pipelined else None
+
+            timer = PromptTimer(row)
+            if self.rate_controller:
+                with timer.stage("rate_wait"):
+                    self.rate_controller.acquire(self.stop_event)
+                if self.stop_event.is_set():
+                    self._give_back(prompt_queue, item, next_item)
+                    return
+
+            session.log(f"\n--- Processing row {row} ---")
+            outcome = self._submit(worker, row, prompt, timer, next_item)
+
+            if outcome is None:
+                # The browser is gone, the supervisor restarts it and resubmits these,
+                # except a prompt it already sent to Whisk
+                if session.enter_sent:
+                    self._finish(row, prompt, SUBMITTED)
+                    self._give_back(prompt_queue, next_item)
+                else:
+                    self._give_back(prompt_queue, item, next_item)
+                return
+
+            if outcome == NO_INPUT:
+                # This tab is unusable, leave its prompts for the other workers
+                self._give_back(prompt_queue, item, next_item)
+                return
+
+            worker.record(outcome)
+            self._update_rate(session, outcome)
+            if self.harvester:
+                # An overloaded prompt still reached Whisk and may produce images; tiles
+                # of a failed one are tagged without saving so no later row claims them
+                with timer.stage("harvest"):
+                    self._harvest(session, row if outcome in (SUBMITTED, OVERLOADED) else None)
+            self._finish(row, prompt, outcome)
+            if self.metrics:
+                extra = {"worker": session.name} if session.name else {}
+                if self.rate_controller:
+                    extra["rate_per_minute"] = round(self.rate_controller.rate, 2)
+                self.metrics.finish(timer, outcome, **extra)
+            if self.resource_policy:
+                self._check_resources(session)
+
+            delay = worker.backoff_delay()
+            if delay:
+                session.log(f"    Backing off for {delay} seconds")
+                self.stop_event.wait(delay)
+
+            item = next_item if self.pipelined else self._next_item(prompt_queue, session)
+
+    def _submit(self, worker, row, prompt, timer, next_item):
+        """
+        Submit a prompt, retrying with backoff if the submit raises before Enter
+
+        Returns the outcome, FAILED once the retries are used up, or None
+        when the browser no longer responds and the pool has been stopped.
+        A submit that raises after pressing Enter is never retried, as
+        Whisk may already be generating the prompt; it counts as SUBMITTED.
+        """
+        session = worker.session
+        attempt = 0
+        while True:
+            try:
+                with timer.stage("slot_wait"):
+                    self.in_flight.acquire()
+                try:
+                    return session.submit(row, prompt, timer, next_prompt=next_item and next_item[1])
+                finally:
+                    self.in_flight.release()
+            except Exception as e:
+                session.log(f"Error processing Whisk input: {e}")
+
+            if not session.is_alive(self.health_timeout):
+                session.log("Browser is not responding, stopping the workers so it can be restarted")
+                self.browser_lost = True
+                self.stop()
+                return None
+            if self.diagnostics:
+                self.diagnostics.screenshot(session, f"row{row:04d}_attempt{attempt + 1}")
+
+            if session.enter_sent:
+                session.log(f"    Row {row} was already sent to Whisk, not submitting it again")
+                return SUBMITTED
+
+            if attempt >= self.max_retries or self.stop_event.is_set():
+                return FAILED
+            attempt += 1
+            delay = min(worker.backoff_base * (2 ** (attempt - 1)), worker.backoff_max)
+            session.log(f"    Retrying row {row} in {delay} seconds (attempt {attempt + 1} of {self.max_retries + 1})")
+            self.stop_event.wait(delay)
+            if self.stop_event.is_set():
+                return FAILED
+
+    def _check_resources(self, session):
+        """Reload the tab or have the browser recycled when it uses too much memory"""
+        try:
+            action = self.resource_policy.check(session)
+            if action == RELOAD_TAB:
+                session.log("    Reloading the Whisk tab to free memory")
+                if self.harvester:
+                    # Tags don't survive a reload, so queued images are saved first
+                    self.harvester.wait_idle()
+                session.reload(self.resource_policy.reload_timeout)
+                if self.harvester:
+                    self._harvest(session, None)
+            elif action == RECYCLE_BROWSER:
+                session.log("    Stopping the workers so the browser can be recycled")
+                self.recycle_requested = True
+                self.stop()
+        except Exception as e:
+            session.log(f"Could not check memory use: {e}")
+
+    def _harvest(self, session, row):
+        """Tag the images the last submit produced and queue them for download"""
+        try:
+            if row is None:
+                session.tag_new_images()
+            else:
+                tags = session.tag_new_images(self.harvester.tile_wait, self.harvester.tiles_per_prompt)
+                self.harvester.submit(session, row, tags)
+        except Exception as e:
+            session.log(f"Could not collect the generated images: {e}")
+
+    def _give_back(self, prompt_queue, *items):
+        """Put claimed (row, prompt) items back in the queue without recording an outcome"""
+        for item in items:
+            if item is None:
+                continue
+            if self.cache:
+                self.cache.release(item[1])
+            prompt_queue.put(item)
+
+    def _finish(self, row, prompt, outcome):
+        """Record the final outcome of a prompt"""
+        if self.cache and outcome in (SUBMITTED, OVERLOADED):
+            self.cache.add(prompt, row, outcome)
+        elif self.cache and outcome == FAILED:
+            self.cache.release(prompt)
+        if self.journal:
+            self.journal.record(row, prompt, outcome)
+        with self.results_lock:
+            self.results.append((row, outcome))
+        if self.progress:
+            self.progress.record(row, outcome)
+        if self.lease_reporter:
+            self.lease_reporter.record(row, outcome)
+
+    def _update_rate(self, session, outcome):
+        """Feed a submit outcome to the rate controller"""
+        if not self.rate_controller:
+            return
+        if outcome == OVERLOADED:
+            self.rate_controller.on_overload()
+            session.log(f"    Submission rate lowered to {self.rate_controller.rate:.1f} prompts/min")
+        elif outcome == SUBMITTED:
+            self.rate_controller.on_success()
+
+    def run(self, prompts):
+        """
+        Submit every (row, prompt) pair and return a list of (row, outcome)
+
+        Blocks until the queue is drained, every worker has given up, or
+        stop() is called.
+        """
+        prompt_queue = queue.Queue()
+        for item in prompts:
+            prompt_queue.put(item)
+
+        threads = [
+            threading.Thread(target=self._work, args=(worker, prompt_queue), daemon=True)
+            for worker in self.workers
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Join with a timeout so Ctrl+C still reaches the main thread
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            raise
+
+        return sorted(self.results)